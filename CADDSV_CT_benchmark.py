@@ -0,0 +1,527 @@
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from multiprocessing import get_context
+
+import numpy as np
+import pandas as pd
+
+from CADDSV_CT_processing import (calc_max_overlap, calc_max_overlap_rowwise, calc_max_path, calc_max_path_rowwise,
+                                  score_frame)
+from pipeline_metrics import peak_rss_mb
+
+"""
+Benchmarks of CT-score processing, loading and plotting on synthetic CADDSV results.
+
+Every benchmark runs in a fresh (spawned) process, so its peak RSS is its own. Wall time and peak RSS are
+appended to a JSONL history and compared with the median of the earlier runs on the same host (regression gate).
+The synthetic results are also the oracle for the columnar code: check_equivalence compares it with the
+row-wise reference versions, and check_oracles adds the chunked / per-chromosome process_file output,
+incremental skipping, interval index queries and exact quantile sketches.
+"""
+
+CHROMS = [str(c) for c in range(1, 23)] + ['X', 'Y']
+SV_TYPES = ['DEL', 'DUP', 'INS', 'INV']
+MALFORMED_SCORES = ['NA', '', '.', '1.2.3', 'nan', 'NaN']
+# Formatting errors: unparsable score, candidate without end coordinate, fewer scores than candidates
+MALFORMED_KINDS = ['score', 'coordinates', 'missing_score']
+# Next to this script (not in the working directory), so runs from anywhere share one history
+HISTORY_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark_history.jsonl')
+
+
+def make_synthetic_results(n_rows, n_candidates=20, not_present_ratio=0.2, seed=0, malformed_ratio=0.0,
+                           malformed_kinds=MALFORMED_KINDS, chrom_weights=None):
+    """
+    Creates a DataFrame in the _fullCADDSV_results.tsv format with random SVs and CT candidates.
+
+    :param n_rows: number of SVs
+    :param n_candidates: maximum number of CT candidates per SV
+    :param not_present_ratio: fraction of SVs without CT candidates ("Not Present")
+    :param seed: seed for the random generator
+    :param malformed_ratio: fraction of SVs with a formatting error
+    :param malformed_kinds: the formatting errors to choose from (MALFORMED_KINDS)
+    :param chrom_weights: dict of chromosome -> relative frequency (default: 1-22, X and Y equally often)
+    """
+    rng = np.random.default_rng(seed)
+    if chrom_weights is None:
+        chroms = rng.choice(CHROMS, size=n_rows)
+    else:
+        weights = np.array(list(chrom_weights.values()), dtype=float)
+        chroms = rng.choice(list(chrom_weights), size=n_rows, p=weights / weights.sum())
+    starts = rng.integers(1, 200_000_000, size=n_rows)
+    ends = starts + rng.integers(50, 100_000, size=n_rows)
+
+    vars_values = []
+    scores_values = []
+    counts = rng.integers(1, n_candidates + 1, size=n_rows)
+    for chrom, start, end, count in zip(chroms, starts, ends, counts):
+        var_starts = start + rng.integers(-10_000, 10_000, size=count)
+        var_ends = var_starts + rng.integers(50, 100_000, size=count)
+        vars_values.append(",".join(f"{chrom}:{s}-{e}" for s, e in zip(var_starts, var_ends)))
+        scores_values.append(",".join(f"{x:.3f}" for x in rng.uniform(0, 50, size=count)))
+
+    not_present = rng.random(n_rows) < not_present_ratio
+    if malformed_ratio > 0:
+        for i in np.flatnonzero(rng.random(n_rows) < malformed_ratio):
+            variants = vars_values[i].split(",")
+            scores = scores_values[i].split(",")
+            position = rng.integers(len(variants))
+            error = malformed_kinds[rng.integers(len(malformed_kinds))]
+            if error == 'score':
+                scores[position] = str(rng.choice(MALFORMED_SCORES))
+            elif error == 'coordinates':
+                variants[position] = f"{chroms[i]}:{variants[position].split(':')[1].split('-')[0]}"
+            elif len(scores) > 1:
+                scores = scores[:-1]
+            vars_values[i] = ",".join(variants)
+            scores_values[i] = ",".join(scores)
+
+    df = pd.DataFrame({
+        'CHROM': chroms,
+        'START': starts,
+        'END': ends,
+        'CADDSV_VARS': np.where(not_present, "Not Present", np.array(vars_values, dtype=object)),
+        'CADDSV_SCORE': np.where(not_present, "Not Present", np.array(scores_values, dtype=object)),
+    })
+    return df
+
+
+def make_processed_results(n_rows, causal_ratio=0.001, seed=0, **kwargs):
+    """
+    Creates a DataFrame in the processed (_CADDSV_CTCPandFT.tsv) format: synthetic results with TYPE, AnnotSV,
+    FT, CAUSAL and CDB_CLASS columns, scored by score_frame.
+
+    :param causal_ratio: fraction of causal variants (Y, y or Y*)
+    :param kwargs: passed on to make_synthetic_results
+    """
+    df = make_synthetic_results(n_rows, seed=seed, **kwargs)
+    rng = np.random.default_rng(seed + 1)
+    df.insert(3, 'TYPE', rng.choice(SV_TYPES, size=n_rows))
+    df.insert(4, 'ANNOTSV_SCORE', np.round(rng.uniform(-1, 1, size=n_rows), 3))
+    df.insert(5, 'ANNOTSV_ACMG_CLASS', rng.integers(1, 6, size=n_rows))
+    ft_scores = np.round(rng.uniform(0, 50, size=n_rows), 3)
+    df.insert(6, 'CADDSV_FT_Score', np.where(rng.random(n_rows) < 0.1, np.nan, ft_scores))
+    df['CAUSAL'] = np.where(rng.random(n_rows) < causal_ratio, rng.choice(['Y', 'y', 'Y*'], size=n_rows), 'N')
+    df['CDB_CLASS'] = rng.choice([f"class {c}" for c in range(1, 6)], size=n_rows)
+    return score_frame(df)
+
+
+def write_inputs(directory, n_rows, n_files=4, seed=0, **kwargs):
+    """
+    Writes the benchmark inputs: one raw _fullCADDSV_results.tsv of n_rows and a cohort directory
+    with n_files processed files of n_rows // n_files rows each.
+    Returns a dict with the paths.
+    """
+    raw_file = os.path.join(directory, 'sample_fullCADDSV_results.tsv')
+    make_synthetic_results(n_rows, seed=seed, **kwargs).to_csv(raw_file, sep='\t', index=False)
+
+    cohort_dir = os.path.join(directory, 'cohort')
+    os.makedirs(cohort_dir, exist_ok=True)
+    cohort_files = []
+    for i in range(n_files):
+        cohort_file = os.path.join(cohort_dir, f'sample{i}_CADDSV_CTCPandFT.tsv')
+        make_processed_results(n_rows // n_files, seed=seed + 10 * i, **kwargs).to_csv(cohort_file, sep='\t',
+                                                                                      index=False)
+        cohort_files.append(cohort_file)
+    return {'directory': directory, 'raw_file': raw_file, 'cohort_dir': cohort_dir, 'cohort_files': cohort_files}
+
+
+def timed(function, *args, **kwargs):
+    """
+    Seconds function(*args, **kwargs) takes.
+    """
+    start = time.perf_counter()
+    function(*args, **kwargs)
+    return time.perf_counter() - start
+
+
+def bench_calc_max_path(inputs):
+    return timed(calc_max_path, pd.read_csv(inputs['raw_file'], sep='\t'))
+
+
+def bench_calc_max_overlap(inputs):
+    return timed(calc_max_overlap, pd.read_csv(inputs['raw_file'], sep='\t'))
+
+
+def bench_calc_max_path_rowwise(inputs):
+    return timed(calc_max_path_rowwise, pd.read_csv(inputs['raw_file'], sep='\t'))
+
+
+def bench_calc_max_overlap_rowwise(inputs):
+    return timed(calc_max_overlap_rowwise, pd.read_csv(inputs['raw_file'], sep='\t'))
+
+
+def bench_process_file(inputs):
+    from CADDSV_CT_processing import process_file
+
+    output_file = os.path.join(inputs['directory'], 'sample_CADDSV_CTCPandFT.tsv')
+    return timed(process_file, inputs['raw_file'], output_file)
+
+
+def bench_read_and_combine_files(inputs):
+    from SRLR_Ranking_nochr_xaxis import SCHEMA, read_and_combine_files
+
+    return timed(read_and_combine_files, inputs['cohort_dir'], 'MAX_PATH_SCORE', schema=SCHEMA)
+
+
+def bench_dot_plot(inputs):
+    from batch_plotting import use_headless_backend
+    use_headless_backend()
+    from SRLR_Ranking_nochr_xaxis import create_dot_plot
+
+    output_plot = os.path.join(inputs['directory'], 'dot_plot.png')
+    return timed(create_dot_plot, inputs['cohort_dir'], output_plot, 'benchmark', 'MAX_PATH_SCORE')
+
+
+def bench_amount_scored(inputs):
+    from batch_plotting import use_headless_backend
+    use_headless_backend()
+    from CADDSV_FT_CT_comparison_multiplefiles import amount_scored
+
+    output = os.path.join(inputs['directory'], 'amount_scored.png')
+    return timed(amount_scored, inputs['cohort_files'], 'benchmark', output, 'CT-O', show=False)
+
+
+def bench_cdb_boxplots(inputs):
+    from batch_plotting import use_headless_backend
+    use_headless_backend()
+    from CDB_correlation_plot import create_boxplots
+
+    output_file = os.path.join(inputs['directory'], 'CDB_{score}.png')
+    return timed(create_boxplots, inputs['cohort_files'][0], output_file,
+                 ['ANNOTSV_SCORE', 'MAX_PATH_SCORE', 'MAX_OVERLAP_SCORE'], show=False)
+
+
+BENCHMARKS = {
+    'calc_max_path': bench_calc_max_path,
+    'calc_max_overlap': bench_calc_max_overlap,
+    'process_file': bench_process_file,
+    'read_and_combine_files': bench_read_and_combine_files,
+    'dot_plot': bench_dot_plot,
+    'amount_scored': bench_amount_scored,
+    'cdb_boxplots': bench_cdb_boxplots,
+}
+# Slow reference versions, only run when asked for
+ROWWISE_BENCHMARKS = {
+    'calc_max_path_rowwise': bench_calc_max_path_rowwise,
+    'calc_max_overlap_rowwise': bench_calc_max_overlap_rowwise,
+}
+
+
+def run_in_process(name, inputs):
+    """
+    Runs one benchmark (in the spawned process) and returns its seconds and peak RSS (None if unknown).
+    """
+    benchmarks = {**BENCHMARKS, **ROWWISE_BENCHMARKS}
+    seconds = benchmarks[name](inputs)
+    return {'seconds': seconds, 'peak_rss_mb': peak_rss_mb()}
+
+
+def run_benchmark(name, inputs):
+    """
+    Runs one benchmark in a fresh process, so peak RSS is not inflated by earlier benchmarks.
+    """
+    with ProcessPoolExecutor(max_workers=1, mp_context=get_context('spawn')) as executor:
+        return executor.submit(run_in_process, name, inputs).result()
+
+
+def git_commit():
+    """
+    Short hash of the checked out commit, None outside a git repository.
+    """
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def read_history(history_file):
+    """
+    All earlier benchmark records of the JSONL history (empty if there is none yet).
+    """
+    if not os.path.exists(history_file):
+        return []
+    with open(history_file) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def append_history(history_file, records):
+    """
+    Appends benchmark records to the JSONL history.
+    """
+    with open(history_file, 'a') as f:
+        for record in records:
+            f.write(json.dumps(record) + '\n')
+
+
+def check_regressions(history, records, tolerance=0.25, window=5):
+    """
+    Compares every record with the median of the last window runs of the same benchmark, inputs and host.
+    Returns a message per regression: more than tolerance (fraction) slower or more peak RSS.
+    """
+    regressions = []
+    for record in records:
+        earlier = [old for old in history
+                   if (old['benchmark'], old['rows'], old.get('inputs'), old['host']) ==
+                   (record['benchmark'], record['rows'], record['inputs'], record['host'])][-window:]
+        if not earlier:
+            continue
+        for metric in ['seconds', 'peak_rss_mb']:
+            values = [old[metric] for old in earlier if old.get(metric) is not None]
+            if record[metric] is None or not values:
+                continue
+            baseline = statistics.median(values)
+            if record[metric] > baseline * (1 + tolerance):
+                regressions.append(f"{record['benchmark']} ({record['rows']} rows): {metric} {record[metric]:.2f} "
+                                   f"vs. median {baseline:.2f} of the last {len(earlier)} runs")
+    return regressions
+
+
+def check_equivalence(n_rows=20_000, seeds=(0, 1, 2), malformed_ratio=0.05, thresholds=(0.0, 0.1, 0.5)):
+    """
+    Equivalence oracle: the columnar calc_max_path and calc_max_overlap must give exactly the results of the
+    row-wise reference versions on synthetic results, including malformed candidates.
+    Raises AssertionError on the first difference.
+
+    SVs with fewer scores than candidates are not generated: calc_max_overlap_rowwise then misaligns
+    overlaps and scores (IndexError or a wrong score), calc_max_overlap drops the candidates without score.
+    """
+    for seed in seeds:
+        df = make_synthetic_results(n_rows, seed=seed, malformed_ratio=malformed_ratio,
+                                    malformed_kinds=['score', 'coordinates'])
+        columns = ['MAX_PATH_SCORE', 'MAX_PATH_VAR']
+        assert calc_max_path(df.copy())[columns].equals(calc_max_path_rowwise(df.copy())[columns]), \
+            f"calc_max_path differs from calc_max_path_rowwise (seed {seed})"
+        for threshold in thresholds:
+            columns = ['MAX_OVERLAP_SCORE', 'MAX_OVERLAP_VAR']
+            assert calc_max_overlap(df.copy(), threshold)[columns].equals(
+                calc_max_overlap_rowwise(df.copy(), threshold)[columns]), \
+                f"calc_max_overlap differs from calc_max_overlap_rowwise (seed {seed}, threshold {threshold})"
+    print(f"Equivalence check passed: {len(seeds)} x {n_rows} rows, malformed ratio {malformed_ratio}.")
+
+
+def check_process_file_outputs(n_rows=5_000, seed=0, malformed_ratio=0.05, chunksize=700, chrom_workers=2):
+    """
+    Oracle of process_file: the chunked and per-chromosome outputs must be byte-identical to the whole-file
+    output, also with malformed candidates, "Not Present" rows and candidate summaries.
+    """
+    from CADDSV_CT_processing import CandidateSummaries, process_file
+
+    summaries = CandidateSummaries(top_k=3, score_threshold=10.0, overlap_mean=True)
+    with tempfile.TemporaryDirectory() as directory:
+        input_file = os.path.join(directory, 'sample_fullCADDSV_results.tsv')
+        make_synthetic_results(n_rows, seed=seed, malformed_ratio=malformed_ratio,
+                               malformed_kinds=['score', 'coordinates']).to_csv(input_file, sep='\t', index=False)
+        outputs = {}
+        for name, kwargs in [('whole', {}), ('chunked', {'chunksize': chunksize}),
+                             ('chromosomes', {'chrom_workers': chrom_workers})]:
+            output_file = os.path.join(directory, f'{name}_CADDSV_CTCPandFT.tsv')
+            process_file(input_file, output_file, summaries=summaries, **kwargs)
+            with open(output_file, 'rb') as f:
+                outputs[name] = f.read()
+    for name in ['chunked', 'chromosomes']:
+        assert outputs[name] == outputs['whole'], f"{name} process_file output differs from the whole-file output"
+    print(f"process_file check passed: whole-file, chunked and per-chromosome outputs identical ({n_rows} rows).")
+
+
+def check_incremental(n_rows=500, seed=0):
+    """
+    Oracle of the incremental batch runs: processed samples are skipped, a changed input or changed
+    parameters are processed again.
+    """
+    from CADDSV_CT_processing import changed_inputs, process_files
+
+    with tempfile.TemporaryDirectory() as directory:
+        input_files = []
+        for i in range(3):
+            input_file = os.path.join(directory, f'sample{i}_fullCADDSV_results.tsv')
+            make_synthetic_results(n_rows, seed=seed + i).to_csv(input_file, sep='\t', index=False)
+            input_files.append(input_file)
+        output_dir = os.path.join(directory, 'processed')
+
+        assert changed_inputs(input_files, output_dir) == input_files, "unprocessed samples were skipped"
+        assert not process_files(input_files, output_dir, workers=1), "process_files failed"
+        assert changed_inputs(input_files, output_dir) == [], "processed samples were not skipped"
+        assert changed_inputs(input_files, output_dir, min_reciprocal_overlap=0.5) == input_files, \
+            "samples were skipped after a parameter change"
+        make_synthetic_results(n_rows, seed=seed + 100).to_csv(input_files[1], sep='\t', index=False)
+        assert changed_inputs(input_files, output_dir) == [input_files[1]], "a changed input was skipped"
+    print("Incremental check passed: unchanged samples skipped, changed inputs and parameters processed.")
+
+
+def check_interval_index(n_variants=20_000, n_rows=2_000, seed=0, thresholds=(0.1, 0.5)):
+    """
+    Oracle of CADDSV_interval_index: scoring raw SVs with the (saved, memory-mapped) index must give exactly
+    the results of the brute-force pre-joined candidates, with variants from 1 bp up to Mb scale.
+    """
+    from CADDSV_interval_index import IntervalIndex
+
+    rng = np.random.default_rng(seed)
+    chroms = ['1', '2', 'X']
+    reference = pd.DataFrame({'CHROM': rng.choice(chroms, n_variants),
+                              'START': rng.integers(0, 5_000_000, n_variants)})
+    lengths = np.where(rng.random(n_variants) < 0.001, rng.integers(1_000_000, 3_000_000, n_variants),
+                       rng.integers(1, 50_000, n_variants))
+    reference['END'] = reference['START'] + lengths
+    reference['CADDSV_SCORE'] = np.round(rng.uniform(0, 50, n_variants), 3)
+
+    starts = rng.integers(0, 5_000_000, n_rows).astype(float)
+    starts[:5] = np.nan
+    svs = pd.DataFrame({'CHROM': rng.choice(['chr1', '2', 'X', 'Y'], n_rows), 'START': starts,
+                        'END': starts + rng.integers(1, 30_000, n_rows)})
+
+    # Brute force: every overlapping variant, in (chromosome, start) order like the index
+    ordered = reference.sort_values(['CHROM', 'START'], kind='stable')
+    caddsv_vars, caddsv_scores = [], []
+    for chrom, start, end in zip(svs['CHROM'], svs['START'], svs['END']):
+        same_chrom = ordered[ordered['CHROM'] == chrom.replace('chr', '')]
+        found = same_chrom[(same_chrom['START'] < end) & (same_chrom['END'] > start)]
+        if np.isnan(start) or len(found) == 0:
+            caddsv_vars.append("Not Present")
+            caddsv_scores.append("Not Present")
+        else:
+            caddsv_vars.append(",".join(f"{c}:{s}-{e}" for c, s, e in zip(found['CHROM'], found['START'],
+                                                                          found['END'])))
+            caddsv_scores.append(",".join(str(score) for score in found['CADDSV_SCORE']))
+    joined = svs.assign(CADDSV_VARS=caddsv_vars, CADDSV_SCORE=caddsv_scores)
+
+    with tempfile.TemporaryDirectory() as index_dir:
+        IntervalIndex.from_frame(reference).save(index_dir)
+        index = IntervalIndex.load(index_dir)
+        for threshold in thresholds:
+            expected = score_frame(joined.copy(), threshold)
+            pd.testing.assert_frame_equal(score_frame(svs.copy(), threshold, index), expected)
+    print(f"Interval index check passed: {n_rows} SVs against {n_variants} variants.")
+
+
+def check_sketches(sizes=(1, 7, 1_000), seed=0):
+    """
+    Oracle of quantile_sketch: up to EXTREMES values the boxplot statistics of a sketch (also one merged from
+    chunks) must be exactly those of matplotlib's boxplot_stats.
+    """
+    from matplotlib import cbook
+
+    from quantile_sketch import EXTREMES, QuantileSketch
+
+    rng = np.random.default_rng(seed)
+    for n in list(sizes) + [EXTREMES]:
+        values = np.round(rng.standard_cauchy(n), 3)
+        expected = cbook.boxplot_stats(values)[0]
+        sketch = QuantileSketch()
+        for chunk in np.array_split(np.r_[values, np.nan], 4):
+            sketch = sketch + QuantileSketch().update(chunk)
+        stats = sketch.boxplot_stats()
+        assert sketch.exact and stats['n'] == n, f"sketch of {n} values is not exact"
+        for key in ['med', 'q1', 'q3', 'whislo', 'whishi']:
+            assert stats[key] == expected[key], f"sketch {key} differs from boxplot_stats ({n} values)"
+        assert np.array_equal(np.sort(stats['fliers']), np.sort(expected['fliers'])), \
+            f"sketch fliers differ from boxplot_stats ({n} values)"
+        assert np.isclose(stats['mean'], expected['mean']), f"sketch mean differs from boxplot_stats ({n} values)"
+    print(f"Sketch check passed: exact boxplot statistics up to {EXTREMES} values.")
+
+
+def check_oracles():
+    """
+    All equivalence checks (raise AssertionError on the first difference).
+    """
+    check_equivalence()
+    check_process_file_outputs()
+    check_incremental()
+    check_interval_index()
+    check_sketches()
+
+
+def parse_chrom_weights(values):
+    """
+    ['Y=0.1', 'X=2'] -> chrom_weights of make_synthetic_results; chromosomes not given keep weight 1.
+    """
+    weights = dict.fromkeys(CHROMS, 1.0)
+    for value in values:
+        chrom, _, weight = value.partition('=')
+        if chrom not in weights:
+            raise ValueError(f"Unknown chromosome '{chrom}', use one of: {', '.join(CHROMS)}")
+        weights[chrom] = float(weight)
+    return weights
+
+
+def run_benchmarks(names, n_rows, n_files=4, history_file=HISTORY_FILE, tolerance=0.25, seed=0, **kwargs):
+    """
+    Writes synthetic inputs, runs the benchmarks, appends them to the history and returns the regressions.
+
+    :param kwargs: passed on to make_synthetic_results (e.g. malformed_ratio, chrom_weights)
+    """
+    history = read_history(history_file)
+    commit = git_commit()
+    records = []
+    with tempfile.TemporaryDirectory() as directory:
+        inputs = write_inputs(directory, n_rows, n_files, seed, **kwargs)
+        for name in names:
+            result = run_benchmark(name, inputs)
+            records.append({
+                'time': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+                'commit': commit,
+                'host': platform.node(),
+                'python': platform.python_version(),
+                'benchmark': name,
+                'rows': n_rows,
+                'inputs': {'files': n_files, 'seed': seed, **kwargs},
+                **result,
+            })
+            peak_rss = f"{result['peak_rss_mb']:.0f} MB" if result['peak_rss_mb'] is not None else "unknown"
+            print(f"{name} on {n_rows} rows: {result['seconds']:.2f}s, peak RSS {peak_rss}")
+
+    regressions = check_regressions(history, records, tolerance)
+    append_history(history_file, records)
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark CT-score processing, loading and plotting.")
+    parser.add_argument('--rows', type=int, default=200_000, help="number of SVs of the synthetic inputs")
+    parser.add_argument('--files', type=int, default=4, help="number of files of the synthetic cohort")
+    parser.add_argument('--only', nargs='+', choices=list(BENCHMARKS) + list(ROWWISE_BENCHMARKS),
+                        help="run only these benchmarks")
+    parser.add_argument('--rowwise', action='store_true', help="also run the row-wise reference versions")
+    parser.add_argument('--malformed-ratio', type=float, default=0.0)
+    parser.add_argument('--candidates', type=int, help="maximum number of CT candidates per SV (default: 20)")
+    parser.add_argument('--not-present-ratio', type=float,
+                        help="fraction of SVs without CT candidates (default: 0.2)")
+    parser.add_argument('--chrom-weights', nargs='+', metavar='CHROM=WEIGHT',
+                        help="relative frequency of chromosomes, e.g. Y=0.1 (others keep weight 1)")
+    parser.add_argument('--history', default=HISTORY_FILE, help="JSONL file with the earlier results")
+    parser.add_argument('--tolerance', type=float, default=0.25, help="allowed slowdown / RSS increase (fraction)")
+    parser.add_argument('--skip-equivalence', action='store_true', help="skip the oracle checks (check_oracles)")
+    args = parser.parse_args()
+    if args.rowwise and args.malformed_ratio > 0:
+        # e.g. fewer scores than candidates crashes calc_max_overlap_rowwise, see check_equivalence
+        parser.error("the row-wise versions cannot be benchmarked on malformed inputs")
+
+    if not args.skip_equivalence:
+        check_oracles()
+
+    # Only the given inputs are recorded, so the history of runs with the defaults stays comparable
+    inputs = {'malformed_ratio': args.malformed_ratio}
+    if args.candidates is not None:
+        inputs['n_candidates'] = args.candidates
+    if args.not_present_ratio is not None:
+        inputs['not_present_ratio'] = args.not_present_ratio
+    if args.chrom_weights is not None:
+        try:
+            inputs['chrom_weights'] = parse_chrom_weights(args.chrom_weights)
+        except ValueError as e:
+            parser.error(str(e))
+
+    names = args.only or list(BENCHMARKS) + (list(ROWWISE_BENCHMARKS) if args.rowwise else [])
+    regressions = run_benchmarks(names, args.rows, args.files, args.history, args.tolerance, **inputs)
+    for regression in regressions:
+        print(f"REGRESSION: {regression}")
+    sys.exit(1 if regressions else 0)
@@ -1,136 +1,780 @@
-import pandas as pd
-
-"""
-Isoleert CT-O en CT-P uit alle CT-scores. 
-Isolates CT-O and CT-P score from all CT-scores for all output results. 
-
-Inputfile bevatten Variant, AnnotSV-score en alle gevonden CT-scores (en bijbehorende varianten). 
-"""
-
-def calc_max_path(df):
-    """
-    Calculate the maximum pathogenic score and its associated variant.
-    """
-    df['MAX_PATH_SCORE'] = None
-    df['MAX_PATH_VAR'] = None
-
-    for index, row in df.iterrows():
-        vars_value = row['CADDSV_VARS']
-        scores_value = row['CADDSV_SCORE']
-
-        if vars_value != "Not Present" and scores_value != "Not Present":
-            # print(vars_value)
-            caddsv_vars = vars_value.split(",")
-            caddsv_scores = []
-
-            # Parse scores, skipping invalid entries (formatting error)
-            for score in scores_value.split(","):
-                try:
-                    caddsv_scores.append(float(score))
-                except ValueError:
-                    caddsv_scores.append(float('-inf'))
-
-            # Find the most pathogenic score
-            if caddsv_scores:
-                max_path_score, max_path_var = max(
-                    zip(caddsv_scores, caddsv_vars),
-                    key=lambda x: x[0]
-                )
-                if max_path_score != float('-inf'):
-                    df.at[index, 'MAX_PATH_SCORE'] = max_path_score
-                    df.at[index, 'MAX_PATH_VAR'] = max_path_var
-
-    return df
-
-def calc_max_overlap(df):
-    """
-    Calculate the variant with the maximum overlap and its associated score, min. 10% reciprocal overlap.
-    """
-    df['MAX_OVERLAP_SCORE'] = None
-    df['MAX_OVERLAP_VAR'] = None
-
-    for index, row in df.iterrows():
-        start_pos = row['START']
-        end_pos = row['END']
-        vars_value = row['CADDSV_VARS']
-        scores_value = row['CADDSV_SCORE']
-
-        if vars_value != "Not Present" and scores_value != "Not Present":
-            caddsv_vars = vars_value.split(",")
-            caddsv_scores = []
-
-            # Parse scores, skipping invalid entries
-            for score in scores_value.split(","):
-                try:
-                    caddsv_scores.append(float(score))
-                except ValueError:
-                    caddsv_scores.append(float('-inf'))
-
-            # Calculate overlaps
-            valid_overlaps = []
-            valid_scores = []
-            valid_vars = []
-
-            for i, var in enumerate(caddsv_vars):
-                try:
-                    var_start, var_end = map(int, var.split(":")[1].split("-"))
-                    overlap = max(0, min(end_pos, var_end) - max(start_pos, var_start))
-
-                    # Calculate the reciprocal overlaps
-                    variant_len = end_pos - start_pos
-                    caddsv_len = var_end - var_start
-
-                    reciprocal_overlap_variant = overlap / variant_len if variant_len > 0 else 0
-                    reciprocal_overlap_caddsv = overlap / caddsv_len if caddsv_len > 0 else 0
-
-                    if reciprocal_overlap_variant >= 0.1 and reciprocal_overlap_caddsv >= 0.1:
-                        valid_overlaps.append(overlap)
-                        valid_scores.append(caddsv_scores[i])
-                        valid_vars.append(var)
-
-                except Exception:
-                    continue
-
-            # Find maximum overlap among valid overlaps
-            if valid_overlaps:
-                max_overlap_idx = valid_overlaps.index(max(valid_overlaps))
-                max_overlap_score = valid_scores[max_overlap_idx]
-                df.at[index, 'MAX_OVERLAP_SCORE'] = max_overlap_score
-                df.at[index, 'MAX_OVERLAP_VAR'] = valid_vars[max_overlap_idx]
-
-    return df
-
-
-def process_file(input_file, output_file):
-    """
-    Main processing function to read the input file, calculate scores, and save the output.
-    """
-    # Load the file into a pandas DataFrame
-    df = pd.read_csv(input_file, sep='\t')
-
-    # Ensure necessary columns exist
-    required_columns = ['CHROM', 'START', 'END', 'CADDSV_VARS', 'CADDSV_SCORE']
-    for col in required_columns:
-        if col not in df.columns:
-            raise ValueError(f"Input file must contain the following columns: {', '.join(required_columns)}")
-
-    # Calculate scores
-    df = calc_max_path(df)
-    df = calc_max_overlap(df)
-
-    # Remove unnecessary columns
-    df.drop(columns=['CADDSV_VARS', 'CADDSV_SCORE'], inplace=True)
-
-    # Save to output file
-    df.to_csv(output_file, sep='\t', index=False)
-    print(f"Processing complete. Updated file saved as '{output_file}'.")
-
-
-if __name__ == "__main__":
-    samplename = "P50-G6"
-    input_file = "FILEPATH_HERE" + samplename +  "_fullCADDSV_results.tsv"
-    output_file = "FILEPATH_HERE" + samplename + "_CADDSV_CTCPandFT.tsv"
-
-    process_file(input_file, output_file)
-
-
+import glob
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import asdict, dataclass
+
+import numpy as np
+import pandas as pd
+
+from CADDSV_results_io import (ChunkedBinaryWriter, binary_path, file_signature, manifest_is_current,
+                               write_binary, write_manifest)
+from pipeline_metrics import enabled as metrics_enabled, stage
+
+"""
+Isoleert CT-O en CT-P uit alle CT-scores. 
+Isolates CT-O and CT-P score from all CT-scores for all output results. 
+
+Inputfile bevatten Variant, AnnotSV-score en alle gevonden CT-scores (en bijbehorende varianten). 
+"""
+
+NOT_PRESENT = "Not Present"
+
+
+def calc_max_path_rowwise(df):
+    """
+    Calculate the maximum pathogenic score and its associated variant (row by row).
+    Reference implementation of calc_max_path.
+    """
+    df['MAX_PATH_SCORE'] = None
+    df['MAX_PATH_VAR'] = None
+
+    for index, row in df.iterrows():
+        vars_value = row['CADDSV_VARS']
+        scores_value = row['CADDSV_SCORE']
+
+        if vars_value != "Not Present" and scores_value != "Not Present":
+            # print(vars_value)
+            caddsv_vars = vars_value.split(",")
+            caddsv_scores = []
+
+            # Parse scores, skipping invalid entries (formatting error)
+            for score in scores_value.split(","):
+                try:
+                    caddsv_scores.append(float(score))
+                except ValueError:
+                    caddsv_scores.append(float('-inf'))
+
+            # Find the most pathogenic score
+            if caddsv_scores:
+                max_path_score, max_path_var = max(
+                    zip(caddsv_scores, caddsv_vars),
+                    key=lambda x: x[0]
+                )
+                if max_path_score != float('-inf'):
+                    df.at[index, 'MAX_PATH_SCORE'] = max_path_score
+                    df.at[index, 'MAX_PATH_VAR'] = max_path_var
+
+    return df
+
+
+def calc_max_overlap_rowwise(df, min_reciprocal_overlap=0.1):
+    """
+    Calculate the variant with the maximum overlap and its associated score, min. 10% reciprocal overlap (row by row).
+    Reference implementation of calc_max_overlap.
+    """
+    df['MAX_OVERLAP_SCORE'] = None
+    df['MAX_OVERLAP_VAR'] = None
+
+    for index, row in df.iterrows():
+        start_pos = row['START']
+        end_pos = row['END']
+        vars_value = row['CADDSV_VARS']
+        scores_value = row['CADDSV_SCORE']
+
+        if vars_value != "Not Present" and scores_value != "Not Present":
+            caddsv_vars = vars_value.split(",")
+            caddsv_scores = []
+
+            # Parse scores, skipping invalid entries
+            for score in scores_value.split(","):
+                try:
+                    caddsv_scores.append(float(score))
+                except ValueError:
+                    caddsv_scores.append(float('-inf'))
+
+            # Calculate overlaps
+            valid_overlaps = []
+            valid_scores = []
+            valid_vars = []
+
+            for i, var in enumerate(caddsv_vars):
+                try:
+                    var_start, var_end = map(int, var.split(":")[1].split("-"))
+                    overlap = max(0, min(end_pos, var_end) - max(start_pos, var_start))
+
+                    # Calculate the reciprocal overlaps
+                    variant_len = end_pos - start_pos
+                    caddsv_len = var_end - var_start
+
+                    reciprocal_overlap_variant = overlap / variant_len if variant_len > 0 else 0
+                    reciprocal_overlap_caddsv = overlap / caddsv_len if caddsv_len > 0 else 0
+
+                    if reciprocal_overlap_variant >= min_reciprocal_overlap and reciprocal_overlap_caddsv >= min_reciprocal_overlap:
+                        valid_overlaps.append(overlap)
+                        valid_scores.append(caddsv_scores[i])
+                        valid_vars.append(var)
+
+                except Exception:
+                    continue
+
+            # Find maximum overlap among valid overlaps
+            if valid_overlaps:
+                max_overlap_idx = valid_overlaps.index(max(valid_overlaps))
+                max_overlap_score = valid_scores[max_overlap_idx]
+                df.at[index, 'MAX_OVERLAP_SCORE'] = max_overlap_score
+                df.at[index, 'MAX_OVERLAP_VAR'] = valid_vars[max_overlap_idx]
+
+    return df
+
+
+def split_candidates(values):
+    """
+    Explode a Series of comma-joined candidate lists.
+    Returns the flat values and the number of values per row.
+    """
+    if len(values) == 0:
+        return np.array([], dtype=object), np.array([], dtype=np.int64)
+    values = values.astype(str)
+    lengths = values.str.count(",").to_numpy(dtype=np.int64) + 1
+    # One split over the joined column is much cheaper than a split (and explode) per row
+    flat = np.array(",".join(values).split(","), dtype=object)
+    return flat, lengths
+
+
+def positions_in_row(lengths):
+    """
+    Position of every exploded value within its own row, e.g. [2, 3] -> [0, 1, 0, 1, 2].
+    """
+    offsets = np.cumsum(lengths) - lengths
+    return np.arange(lengths.sum()) - np.repeat(offsets, lengths)
+
+
+@dataclass
+class CandidateTable:
+    """
+    CT candidates of all SVs, parsed once (CSR layout) and shared by all CT-derived scores.
+
+    The candidates of SV rows[i] (row position in df) are [offsets[i], offsets[i + 1]) of the flat arrays.
+    Unparsable scores are -inf and 'nan' scores NaN, candidates with unparsable coordinates
+    have valid_coordinates False. Coordinates are None when parsed with coordinates=False.
+    unpaired is the number of candidates and scores dropped because their row has more of one than the other.
+    """
+    n_rows: int
+    rows: np.ndarray
+    offsets: np.ndarray
+    variants: np.ndarray
+    scores: np.ndarray
+    starts: np.ndarray = None
+    ends: np.ndarray = None
+    valid_coordinates: np.ndarray = None
+    unpaired: int = 0
+
+    @property
+    def n_candidates(self):
+        """
+        Number of candidates per SV in rows.
+        """
+        return np.diff(self.offsets)
+
+
+def parse_scores(values):
+    """
+    Parse candidate scores like float() in the row-wise versions: unparsable scores are -inf,
+    a literal 'nan' stays NaN.
+    """
+    values = pd.Series(values, dtype=object)
+    scores = pd.to_numeric(values, errors='coerce').to_numpy(dtype=np.float64, copy=True)
+    missing = np.flatnonzero(np.isnan(scores))
+    literal_nan = values.iloc[missing].str.strip().str.lower().isin(['nan', '+nan', '-nan']).to_numpy()
+    scores[missing[~literal_nan]] = -np.inf
+    return scores
+
+
+def parse_candidates(df, coordinates=True):
+    """
+    Tokenize CADDSV_VARS and CADDSV_SCORE of all rows with candidates into a CandidateTable.
+    Like zip() in the row-wise versions, candidates without a score and scores without a candidate are dropped.
+    """
+    vars_col = df['CADDSV_VARS']
+    scores_col = df['CADDSV_SCORE']
+    present = (vars_col.notna() & scores_col.notna() &
+               (vars_col != NOT_PRESENT) & (scores_col != NOT_PRESENT))
+    rows = np.flatnonzero(present.to_numpy())
+
+    caddsv_vars, n_vars = split_candidates(vars_col.iloc[rows])
+    caddsv_scores, n_scores = split_candidates(scores_col.iloc[rows])
+
+    n_pairs = np.minimum(n_vars, n_scores)
+    caddsv_vars = caddsv_vars[positions_in_row(n_vars) < np.repeat(n_pairs, n_vars)]
+    caddsv_scores = caddsv_scores[positions_in_row(n_scores) < np.repeat(n_pairs, n_scores)]
+
+    candidates = CandidateTable(
+        n_rows=len(df),
+        rows=rows,
+        offsets=np.r_[0, np.cumsum(n_pairs)],
+        variants=caddsv_vars,
+        scores=parse_scores(caddsv_scores),
+        unpaired=int((n_vars - n_pairs).sum() + (n_scores - n_pairs).sum()),
+    )
+    if coordinates:
+        candidates.starts, candidates.ends, candidates.valid_coordinates = parse_coordinates(caddsv_vars)
+    return candidates
+
+
+def row_argmax(values, n_pairs):
+    """
+    Grouped arg-max over consecutive rows of n_pairs values each (every row needs at least one value).
+    Returns the maximum per row and the flat index of its first occurrence.
+    """
+    offsets = np.cumsum(n_pairs) - n_pairs
+    row_max = np.maximum.reduceat(values, offsets)
+    is_max = np.flatnonzero(values == np.repeat(row_max, n_pairs))
+    row_of_max = np.repeat(np.arange(len(n_pairs)), n_pairs)[is_max]
+    first_max = is_max[np.r_[True, row_of_max[1:] != row_of_max[:-1]]]
+    return row_max, first_max
+
+
+def set_result_columns(df, score_column, var_column, rows, scores, variants):
+    """
+    Write results for the given row positions, None elsewhere (object dtype like the row-wise versions).
+    """
+    result_scores = np.full(len(df), None, dtype=object)
+    result_vars = np.full(len(df), None, dtype=object)
+    result_scores[rows] = scores.tolist()
+    result_vars[rows] = variants
+    df[score_column] = pd.Series(result_scores, index=df.index, dtype=object)
+    df[var_column] = pd.Series(result_vars, index=df.index, dtype=object)
+
+
+def calc_max_path(df, candidates=None):
+    """
+    Calculate the maximum pathogenic score and its associated variant.
+
+    Columnar version of calc_max_path_rowwise: the arg-max of the candidate scores is taken per row.
+    Ties go to the first candidate. Like max() in the row-wise version NaN scores are skipped, unless the
+    first candidate has a NaN score: then that is the result. Pass candidates (parse_candidates) to reuse an
+    earlier parse.
+    """
+    df['MAX_PATH_SCORE'] = None
+    df['MAX_PATH_VAR'] = None
+
+    if candidates is None:
+        candidates = parse_candidates(df, coordinates=False)
+    if len(candidates.rows) == 0:
+        return df
+
+    scores = np.where(np.isnan(candidates.scores), -np.inf, candidates.scores)
+    row_max, first_max = row_argmax(scores, candidates.n_candidates)
+    first = candidates.offsets[:-1]
+    nan_first = np.isnan(candidates.scores[first])
+    row_max[nan_first] = np.nan
+    first_max[nan_first] = first[nan_first]
+
+    found = row_max != -np.inf
+    set_result_columns(df, 'MAX_PATH_SCORE', 'MAX_PATH_VAR', candidates.rows[found],
+                       row_max[found], candidates.variants[first_max[found]])
+
+    return df
+
+
+def parse_coordinates(caddsv_vars):
+    """
+    Parse 'chr:start-end' candidates into int64 start and end arrays.
+    Returns (starts, ends, valid), invalid candidates get start = end = 0.
+    """
+    coords = pd.Series(caddsv_vars, dtype=object).str.extract(
+        r'^[^:]*:\s*([0-9]+)\s*-\s*([0-9]+)\s*(?::|$)')
+    valid = coords[0].notna().to_numpy()
+    starts = np.zeros(len(caddsv_vars), dtype=np.int64)
+    ends = np.zeros(len(caddsv_vars), dtype=np.int64)
+    starts[valid] = coords[0][valid].astype(np.int64).to_numpy()
+    ends[valid] = coords[1][valid].astype(np.int64).to_numpy()
+    return starts, ends, valid
+
+
+def reciprocal_overlaps(start, end, var_start, var_end):
+    """
+    Overlap and both reciprocal overlap fractions for arrays of SV / candidate pairs.
+    Fractions are 0 for zero-length intervals.
+    """
+    overlap = np.maximum(0, np.minimum(end, var_end) - np.maximum(start, var_start))
+    variant_len = end - start
+    caddsv_len = var_end - var_start
+
+    reciprocal_overlap_variant = np.divide(overlap, variant_len, out=np.zeros(len(overlap)),
+                                           where=variant_len > 0)
+    reciprocal_overlap_caddsv = np.divide(overlap, caddsv_len, out=np.zeros(len(overlap)),
+                                          where=caddsv_len > 0)
+    return overlap, reciprocal_overlap_variant, reciprocal_overlap_caddsv
+
+
+def candidate_overlaps(df, candidates, min_reciprocal_overlap=0.1):
+    """
+    Overlap (bp) of every candidate with its SV, and whether it counts: valid coordinates on both sides
+    and min. min_reciprocal_overlap reciprocal overlap.
+    """
+    # SVs without coordinates never match, like the row-wise version
+    n_pairs = candidates.n_candidates
+    positions = df[['START', 'END']].iloc[candidates.rows]
+    has_position = np.repeat(positions.notna().all(axis=1).to_numpy(), n_pairs)
+    start = np.repeat(positions['START'].fillna(0).to_numpy(dtype=np.int64), n_pairs)
+    end = np.repeat(positions['END'].fillna(0).to_numpy(dtype=np.int64), n_pairs)
+
+    overlap, reciprocal_overlap_variant, reciprocal_overlap_caddsv = reciprocal_overlaps(
+        start, end, candidates.starts, candidates.ends)
+    valid = (candidates.valid_coordinates & has_position &
+             (reciprocal_overlap_variant >= min_reciprocal_overlap) &
+             (reciprocal_overlap_caddsv >= min_reciprocal_overlap))
+    return overlap, valid
+
+
+def calc_max_overlap(df, min_reciprocal_overlap=0.1, candidates=None):
+    """
+    Calculate the variant with the maximum overlap and its associated score,
+    min. 10% (min_reciprocal_overlap) reciprocal overlap.
+
+    Columnar version of calc_max_overlap_rowwise: the overlaps of all SV / candidate pairs are computed at once.
+    Pass candidates (parse_candidates) to reuse an earlier parse.
+    """
+    df['MAX_OVERLAP_SCORE'] = None
+    df['MAX_OVERLAP_VAR'] = None
+
+    if candidates is None or candidates.starts is None:
+        candidates = parse_candidates(df)
+    if len(candidates.rows) == 0:
+        return df
+
+    overlap, valid = candidate_overlaps(df, candidates, min_reciprocal_overlap)
+
+    # Find maximum overlap among valid overlaps, -1 marks invalid candidates
+    row_max, first_max = row_argmax(np.where(valid, overlap, -1), candidates.n_candidates)
+
+    found = row_max >= 0
+    set_result_columns(df, 'MAX_OVERLAP_SCORE', 'MAX_OVERLAP_VAR', candidates.rows[found],
+                       candidates.scores[first_max[found]], candidates.variants[first_max[found]])
+
+    return df
+
+
+@dataclass
+class CandidateSummaries:
+    """
+    Extra per-SV summaries of the CT candidates, computed from the same parse as MAX_PATH and MAX_OVERLAP
+    (all off by default):
+
+    top_k: the k highest candidate scores and their variants (TOP1_PATH_SCORE, TOP1_PATH_VAR, ...)
+    score_threshold: number of candidates with a score above it (PATH_COUNT_ABOVE)
+    overlap_mean: mean candidate score weighted by overlap in bp (OVERLAP_MEAN_SCORE), over the candidates
+                  that count for MAX_OVERLAP (min_reciprocal_overlap)
+    """
+    top_k: int = 0
+    score_threshold: float = None
+    overlap_mean: bool = False
+
+    @property
+    def enabled(self):
+        return self.top_k > 0 or self.score_threshold is not None or self.overlap_mean
+
+
+def candidate_rows(candidates):
+    """
+    Row position in df of every candidate.
+    """
+    return np.repeat(candidates.rows, candidates.n_candidates)
+
+
+def calc_top_k(df, k, candidates=None):
+    """
+    The k highest candidate scores per SV (float32) and their variants, highest first; ties go to the first
+    candidate like in calc_max_path. SVs with fewer scored candidates get missing values in the last columns.
+    """
+    if candidates is None:
+        candidates = parse_candidates(df, coordinates=False)
+    top_scores = np.full((len(df), k), np.nan, dtype=np.float32)
+    top_vars = np.full((len(df), k), None, dtype=object)
+
+    if len(candidates.rows) > 0:
+        # Stable sort on (row, descending score); rows are already in order, so ranks are positions in the row
+        rows = candidate_rows(candidates)
+        order = np.lexsort((-candidates.scores, rows))
+        rank = positions_in_row(candidates.n_candidates)
+        keep = (rank < k) & (candidates.scores[order] > -np.inf)
+        top_scores[rows[keep], rank[keep]] = candidates.scores[order][keep]
+        top_vars[rows[keep], rank[keep]] = candidates.variants[order][keep]
+
+    for i in range(k):
+        df[f'TOP{i + 1}_PATH_SCORE'] = pd.Series(top_scores[:, i], index=df.index)
+        df[f'TOP{i + 1}_PATH_VAR'] = pd.Series(top_vars[:, i], index=df.index, dtype=object)
+    return df
+
+
+def calc_count_above(df, threshold, candidates=None):
+    """
+    Number of candidates per SV with a score above threshold (int32, 0 without candidates).
+    """
+    if candidates is None:
+        candidates = parse_candidates(df, coordinates=False)
+    above = candidates.scores > threshold
+    counts = np.bincount(candidate_rows(candidates)[above], minlength=len(df)).astype(np.int32)
+    df['PATH_COUNT_ABOVE'] = pd.Series(counts, index=df.index)
+    return df
+
+
+def calc_overlap_mean(df, min_reciprocal_overlap=0.1, candidates=None):
+    """
+    Mean candidate score per SV weighted by the overlap (bp) of the candidate, over the candidates with
+    min. min_reciprocal_overlap reciprocal overlap and a valid score (float32, missing if there are none).
+    """
+    if candidates is None or candidates.starts is None:
+        candidates = parse_candidates(df)
+    weighted = np.zeros(len(df))
+    weights = np.zeros(len(df))
+
+    if len(candidates.rows) > 0:
+        overlap, valid = candidate_overlaps(df, candidates, min_reciprocal_overlap)
+        valid &= (candidates.scores > -np.inf) & (overlap > 0)
+        rows = candidate_rows(candidates)[valid]
+        weighted = np.bincount(rows, weights=overlap[valid] * candidates.scores[valid], minlength=len(df))
+        weights = np.bincount(rows, weights=overlap[valid].astype(np.float64), minlength=len(df))
+
+    mean = np.divide(weighted, weights, out=np.full(len(df), np.nan), where=weights > 0)
+    df['OVERLAP_MEAN_SCORE'] = pd.Series(mean.astype(np.float32), index=df.index)
+    return df
+
+
+def calc_summaries(df, summaries, min_reciprocal_overlap=0.1, candidates=None):
+    """
+    Add the columns of the enabled CandidateSummaries.
+    """
+    if candidates is None or candidates.starts is None:
+        candidates = parse_candidates(df)
+    if summaries.top_k > 0:
+        df = calc_top_k(df, summaries.top_k, candidates)
+    if summaries.score_threshold is not None:
+        df = calc_count_above(df, summaries.score_threshold, candidates)
+    if summaries.overlap_mean:
+        df = calc_overlap_mean(df, min_reciprocal_overlap, candidates)
+    return df
+
+
+REQUIRED_COLUMNS = ['CHROM', 'START', 'END', 'CADDSV_VARS', 'CADDSV_SCORE']
+CANDIDATE_COLUMNS = ['CADDSV_VARS', 'CADDSV_SCORE']
+POSITION_COLUMNS = ['CHROM', 'START', 'END']
+
+
+def check_columns(columns, required=REQUIRED_COLUMNS):
+    """
+    Ensure necessary columns exist.
+    """
+    for col in required:
+        if col not in columns:
+            raise ValueError(f"Input file must contain the following columns: {', '.join(required)}")
+
+
+def load_reference_index(reference_index):
+    """
+    IntervalIndex for a saved index directory (memory-mapped), an IntervalIndex is returned as is.
+    """
+    if isinstance(reference_index, str):
+        from CADDSV_interval_index import IntervalIndex
+        return IntervalIndex.load(reference_index)
+    return reference_index
+
+
+def candidate_counters(candidates):
+    """
+    Counts of skipped and malformed CT candidates (metrics of score_frame).
+    """
+    counters = {
+        'rows_without_candidates': int(candidates.n_rows - len(candidates.rows)),
+        'candidates': int(len(candidates.scores)),
+        'unparsable_scores': int(np.isneginf(candidates.scores).sum()),
+        'unpaired_candidates': candidates.unpaired,
+    }
+    if candidates.valid_coordinates is not None:
+        counters['invalid_coordinates'] = int((~candidates.valid_coordinates).sum())
+    return counters
+
+
+def score_frame(df, min_reciprocal_overlap=0.1, reference_index=None, summaries=None):
+    """
+    Calculate MAX_PATH and MAX_OVERLAP for a DataFrame (whole file or chunk) and drop the candidate columns.
+
+    :param reference_index: IntervalIndex (or its directory) to look up the candidates of every SV,
+                            instead of the pre-joined CADDSV_VARS and CADDSV_SCORE columns
+    :param summaries: CandidateSummaries to add from the same parse
+    """
+    with stage('score_frame', rows=len(df)) as metrics:
+        if reference_index is None:
+            check_columns(df.columns)
+            # Calculate scores, CADDSV_VARS and CADDSV_SCORE are parsed only once
+            candidates = parse_candidates(df)
+        else:
+            check_columns(df.columns, POSITION_COLUMNS)
+            candidates = load_reference_index(reference_index).query(df)
+        df = calc_max_path(df, candidates)
+        df = calc_max_overlap(df, min_reciprocal_overlap, candidates)
+        if summaries is not None and summaries.enabled:
+            df = calc_summaries(df, summaries, min_reciprocal_overlap, candidates)
+
+        if metrics_enabled():
+            metrics.update(candidate_counters(candidates))
+            metrics['max_path_found'] = int(df['MAX_PATH_SCORE'].notna().sum())
+            metrics['max_overlap_found'] = int(df['MAX_OVERLAP_SCORE'].notna().sum())
+
+    # Remove unnecessary columns
+    df.drop(columns=[col for col in CANDIDATE_COLUMNS if col in df.columns], inplace=True)
+    return df
+
+
+def read_input(input_file):
+    """
+    Read a whole _fullCADDSV_results.tsv file with one dtype per column (low_memory=False: no per-block
+    inference, so a column with a few text values is text in all rows, like in the chunked version).
+    """
+    return pd.read_csv(input_file, sep='\t', low_memory=False, dtype={col: str for col in CANDIDATE_COLUMNS})
+
+
+def infer_dtypes(input_file, chunksize):
+    """
+    Determine per column the dtype pandas infers when reading the whole file, reading it chunk by chunk.
+    The candidate columns are skipped, they are always strings. Used to give every chunk the same dtypes.
+    """
+    chunk_dtypes = {}
+    reader = pd.read_csv(input_file, sep='\t', chunksize=chunksize,
+                         usecols=lambda col: col not in CANDIDATE_COLUMNS)
+    for chunk in reader:
+        for col, dtype in chunk.dtypes.items():
+            chunk_dtypes.setdefault(col, set()).add(dtype)
+
+    dtypes = {}
+    for col, found in chunk_dtypes.items():
+        if len(found) == 1:
+            dtypes[col] = found.pop()
+        elif all(dtype.kind in 'iuf' for dtype in found):
+            # e.g. an int column with missing values in only some of the chunks
+            dtypes[col] = np.float64
+        else:
+            dtypes[col] = str
+    for col in CANDIDATE_COLUMNS:
+        dtypes[col] = str
+    return dtypes
+
+
+def score_frame_by_chrom(df, min_reciprocal_overlap=0.1, workers=None, reference_index=None, summaries=None):
+    """
+    score_frame with the chromosomes of one file processed in parallel; the original row order is kept.
+    """
+    check_columns(df.columns, REQUIRED_COLUMNS if reference_index is None else POSITION_COLUMNS)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(score_frame, chrom_df, min_reciprocal_overlap, reference_index, summaries)
+                   for _, chrom_df in df.groupby('CHROM', sort=False, dropna=False)]
+        scored = [future.result() for future in futures]
+    return pd.concat(scored).sort_index()
+
+
+def process_file(input_file, output_file, min_reciprocal_overlap=0.1, chunksize=None, chrom_workers=None,
+                 binary_format=None, reference_index=None, summaries=None):
+    """
+    Main processing function to read the input file, calculate scores, and save the output.
+
+    :param chunksize: if given, stream the file in chunks of this many rows and append
+                      each processed chunk to the output (bounded memory, same output)
+    :param chrom_workers: if given, process the chromosomes in parallel with this many processes
+    :param binary_format: also write a typed 'feather' or 'parquet' file next to the output TSV
+    :param reference_index: IntervalIndex or directory of a saved one (CADDSV_interval_index); the input
+                            then only needs CHROM, START and END, candidates are looked up in the index
+    :param summaries: CandidateSummaries, extra columns from the same candidate parse (default: none)
+    """
+    with stage('process_file', file=input_file) as file_metrics:
+        if chunksize is not None:
+            if chrom_workers is not None:
+                raise ValueError("chunksize and chrom_workers cannot be combined")
+            file_metrics['rows'] = process_file_chunked(input_file, output_file, min_reciprocal_overlap, chunksize,
+                                                        binary_format, reference_index, summaries)
+            record_manifest(input_file, output_file, min_reciprocal_overlap, binary_format, reference_index,
+                            summaries)
+            return
+
+        # A saved index is passed to the chromosome processes as its directory, they memory-map it themselves
+        index = reference_index if chrom_workers is not None else load_reference_index(reference_index)
+
+        # Load the file into a pandas DataFrame
+        with stage('read', file=input_file) as metrics:
+            df = read_input(input_file)
+            metrics['rows'] = file_metrics['rows'] = len(df)
+
+        if chrom_workers is not None and len(df) > 0:
+            df = score_frame_by_chrom(df, min_reciprocal_overlap, chrom_workers, index, summaries)
+        else:
+            df = score_frame(df, min_reciprocal_overlap, index, summaries)
+
+        # Save to output file
+        with stage('write', rows=len(df), file=output_file):
+            df.to_csv(output_file, sep='\t', index=False)
+            if binary_format is not None:
+                write_binary(df, output_file, binary_format)
+        record_manifest(input_file, output_file, min_reciprocal_overlap, binary_format, reference_index, summaries)
+        print(f"Processing complete. Updated file saved as '{output_file}'.")
+
+
+def processing_params(min_reciprocal_overlap=0.1, binary_format=None, reference_index=None, summaries=None):
+    """
+    Parameters that determine the output of process_file, as recorded in its manifest
+    (chunksize and chrom_workers give the same output and are left out).
+    A saved reference index is recorded by the sizes and mtimes of its files.
+    Summaries are only recorded when enabled, so manifests of runs without them stay current.
+    """
+    if isinstance(reference_index, str):
+        index_files = sorted(os.path.join(reference_index, name) for name in os.listdir(reference_index))
+        reference_index = {'path': os.path.abspath(reference_index), 'files': file_signature(index_files)}
+    elif reference_index is not None:
+        # An index in memory cannot be checked later, so such outputs are never skipped
+        reference_index = {'in_memory': True}
+    params = {'min_reciprocal_overlap': min_reciprocal_overlap, 'binary_format': binary_format,
+              'reference_index': reference_index}
+    if summaries is not None and summaries.enabled:
+        params['summaries'] = asdict(summaries)
+    return params
+
+
+def record_manifest(input_file, output_file, min_reciprocal_overlap=0.1, binary_format=None, reference_index=None,
+                    summaries=None):
+    """
+    Write <output_file>.manifest.json (input hash, parameters, outputs) for incremental batch runs.
+    """
+    outputs = [output_file] if binary_format is None else [output_file, binary_path(output_file, binary_format)]
+    write_manifest(output_file, input_file,
+                   processing_params(min_reciprocal_overlap, binary_format, reference_index, summaries), outputs)
+
+
+def process_file_chunked(input_file, output_file, min_reciprocal_overlap=0.1, chunksize=100_000, binary_format=None,
+                         reference_index=None, summaries=None):
+    """
+    Streaming version of process_file: reads, processes and appends chunksize rows at a time.
+    A first pass fixes the dtypes of all columns, so every chunk is written like the whole-file read.
+    Returns the number of rows.
+    """
+    check_columns(pd.read_csv(input_file, sep='\t', nrows=0).columns,
+                  REQUIRED_COLUMNS if reference_index is None else POSITION_COLUMNS)
+    dtypes = infer_dtypes(input_file, chunksize)
+    reference_index = load_reference_index(reference_index)
+
+    binary_writer = ChunkedBinaryWriter(output_file, binary_format) if binary_format is not None else None
+
+    header = True
+    rows = 0
+    reader = pd.read_csv(input_file, sep='\t', chunksize=chunksize, dtype=dtypes)
+    for chunk in reader:
+        rows += len(chunk)
+        chunk = score_frame(chunk, min_reciprocal_overlap, reference_index, summaries)
+        chunk.to_csv(output_file, sep='\t', index=False, header=header, mode='w' if header else 'a')
+        if binary_writer is not None:
+            binary_writer.write(chunk)
+        header = False
+
+    # File without variants: only write the header
+    if header:
+        df = score_frame(pd.read_csv(input_file, sep='\t', nrows=0), min_reciprocal_overlap, reference_index,
+                         summaries)
+        df.to_csv(output_file, sep='\t', index=False)
+        if binary_writer is not None:
+            binary_writer.write(df)
+    if binary_writer is not None:
+        binary_writer.close()
+
+    print(f"Processing complete. Updated file saved as '{output_file}'.")
+    return rows
+
+
+def output_path(input_file, output_dir=None):
+    """
+    Output file for an input file: <sample>_fullCADDSV_results.tsv -> <sample>_CADDSV_CTCPandFT.tsv
+    (in output_dir if given, else next to the input file).
+    """
+    directory, filename = os.path.split(input_file)
+    samplename = filename.replace("_fullCADDSV_results.tsv", "").replace(".tsv", "")
+    return os.path.join(output_dir if output_dir is not None else directory, samplename + "_CADDSV_CTCPandFT.tsv")
+
+
+def changed_inputs(input_files, output_dir=None, min_reciprocal_overlap=0.1, binary_format=None,
+                   reference_index=None, summaries=None):
+    """
+    The input files whose outputs are not current (manifest_is_current) for these parameters, in input order.
+    Prints how many samples are skipped.
+    """
+    params = processing_params(min_reciprocal_overlap, binary_format, reference_index, summaries)
+    changed = [input_file for input_file in input_files
+               if not manifest_is_current(output_path(input_file, output_dir), input_file, params)]
+    if len(changed) < len(input_files):
+        print(f"{len(input_files) - len(changed)} of {len(input_files)} samples unchanged, skipped.")
+    return changed
+
+
+def batch_summary(input_files, changed, failures):
+    """
+    Processed, unchanged and failed samples of a batch, for the stage metrics.
+    """
+    return {'processed': len(changed) - len(failures), 'unchanged': len(input_files) - len(changed),
+            'failed': len(failures)}
+
+
+def print_batch_summary(input_files, changed, failures):
+    summary = batch_summary(input_files, changed, failures)
+    print(f"Batch complete: {summary['processed']} processed, {summary['unchanged']} unchanged, "
+          f"{summary['failed']} failed.")
+
+
+def process_files(input_files, output_dir=None, workers=None, min_reciprocal_overlap=0.1,
+                  chunksize=None, chrom_workers=None, binary_format=None, reference_index=None, incremental=True,
+                  summaries=None):
+    """
+    Run process_file for many samples in a process pool.
+    A failing sample is reported and collected instead of aborting the batch.
+
+    :param input_files: list of _fullCADDSV_results.tsv files or a glob pattern
+    :param output_dir: directory for the output files (default: next to each input file)
+    :param workers: number of processes (default: number of CPUs)
+    :param chunksize: passed on to process_file
+    :param chrom_workers: passed on to process_file, processes per sample for the chromosomes
+    :param binary_format: passed on to process_file
+    :param reference_index: directory of a saved IntervalIndex, passed on to process_file
+    :param incremental: skip samples whose manifest shows the same input contents and parameters
+                        and unchanged outputs
+    :param summaries: CandidateSummaries, passed on to process_file
+    :return: dict of failed input files and their error
+    """
+    if isinstance(input_files, str):
+        input_files = sorted(glob.glob(input_files))
+    if output_dir is not None:
+        os.makedirs(output_dir, exist_ok=True)
+
+    failures = {}
+    start = time.perf_counter()
+
+    changed = input_files
+    if incremental:
+        changed = changed_inputs(input_files, output_dir, min_reciprocal_overlap, binary_format, reference_index,
+                                 summaries)
+
+    with stage('process_files', files=len(input_files)) as metrics:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {
+                executor.submit(process_file, input_file, output_path(input_file, output_dir),
+                                min_reciprocal_overlap, chunksize, chrom_workers, binary_format,
+                                reference_index, summaries): input_file
+                for input_file in changed
+            }
+            for done, future in enumerate(as_completed(futures), start=1):
+                input_file = futures[future]
+                try:
+                    future.result()
+                    status = "done"
+                except Exception as e:
+                    failures[input_file] = f"{type(e).__name__}: {e}"
+                    status = f"FAILED ({failures[input_file]})"
+                print(f"[{done}/{len(futures)}] {os.path.basename(input_file)} {status} "
+                      f"({time.perf_counter() - start:.1f}s)")
+        metrics.update(batch_summary(input_files, changed, failures))
+
+    print_batch_summary(input_files, changed, failures)
+    return failures
+
+
+if __name__ == "__main__":
+    # e.g. python CADDSV_CT_processing.py "FILEPATH_HERE*_fullCADDSV_results.tsv"
+    import sys
+    from pipeline_cli import main
+
+    sys.exit(main(['process'] + sys.argv[1:]))
@@ -1,105 +1,135 @@
-import pandas as pd
+from dataclasses import dataclass
+
 import matplotlib.pyplot as plt
 import numpy as np
 
+from CADDSV_results_io import iter_results, read_many
+from pipeline_metrics import stage
+
 """
 CADDSV FT and CT comparison in Barplot
 """
 
-def amount_scored(input_files, samplename, output, score):
+FT_SCORE = 'CADDSV_FT_Score'
+CT_SCORES = {'CT-O': 'MAX_OVERLAP_SCORE', 'CT-P': 'MAX_PATH_SCORE'}
+
+# Only these columns are read, scores are only counted so float32 is precise enough
+SCHEMA = {
+    'CHROM': 'category',
+    FT_SCORE: 'float32',
+    'MAX_PATH_SCORE': 'float32',
+    'MAX_OVERLAP_SCORE': 'float32',
+}
+
+
+@dataclass
+class ScoredCounts:
+    """
+    Counts of the barplot of amount_scored, for a file or a chunk of one. a + b are the counts of both,
+    so files can be counted separately (and in different processes) without combining them.
+    """
+    total: int = 0
+    ft_scored: int = 0
+    ct_scored: int = 0
+    y_chr_ft_null: int = 0
+    y_chr_ct_null: int = 0
+    noy_chr_ft_null: int = 0
+    noy_chr_ct_null: int = 0
+
+    @classmethod
+    def from_frame(cls, df, score_column):
+        y_chr = (df['CHROM'] == 'Y').to_numpy(dtype=bool, na_value=False)
+        ft_null = df[FT_SCORE].isnull().to_numpy()
+        ct_null = df[score_column].isnull().to_numpy()
+        return cls(
+            total=len(df),
+            ft_scored=int((~ft_null).sum()),
+            ct_scored=int((~ct_null).sum()),
+            y_chr_ft_null=int((ft_null & y_chr).sum()),
+            y_chr_ct_null=int((ct_null & y_chr).sum()),
+            noy_chr_ft_null=int((ft_null & ~y_chr).sum()),
+            noy_chr_ct_null=int((ct_null & ~y_chr).sum()),
+        )
+
+    def __add__(self, other):
+        return ScoredCounts(*(a + b for a, b in zip(vars(self).values(), vars(other).values())))
+
+
+def scored_counts(input_file, score, chunksize=None):
+    """
+    ScoredCounts of one processed file, read in chunks of chunksize rows (default: at once).
+    """
+    score_column = CT_SCORES[score]
+    counts = ScoredCounts()
+    # The whole SCHEMA for either score, so CT-O and CT-P share the read_results memo
+    for chunk in iter_results(input_file, SCHEMA, chunksize):
+        counts = counts + ScoredCounts.from_frame(chunk, score_column)
+    return counts
+
+
+def amount_scored(input_files, samplename, output, score, workers=None, executor='thread', show=True,
+                  chunksize=None):
     """
     Creates barplot showing total variants, amount scored by FT and by CT.
     Not-scored seperated in located on Y-chr and not located on Y-chr.
+    Errors (no input files, unreadable files or missing columns) are raised, callers report them.
+
+    :param workers: load the input files concurrently with this many threads/processes
+    :param executor: 'thread' (I/O-bound) or 'process' (CPU-bound parsing)
+    :param show: show the plot (blocks until the window is closed), use False for batch runs
+    :param chunksize: count every file in chunks of this many rows (ScoredCounts), so memory does not grow
+                      with the file size; the files are never combined
     """
-    try:
-        combined_data = []
-
-        # Loop through input files to read and combine data
-        for file in input_files:
-            df = pd.read_csv(file, sep='\t')
-            combined_data.append(df)
-
-        # Concatenate all dataframes
-        combined_df = pd.concat(combined_data, ignore_index=True)
-
-        # Extract relevant columns
-        ft_scores = combined_df.iloc[:, 8]  # Column 9 ('CADDSV_FT_Score')
-        if score == 'CT-O':
-            score_column = 11 # Column 12 ('MAX_OVERLAP')
-
-        elif score == 'CT-P':
-            score_column = 9 # Column 10 ('MAX_PATH_SCORE')
-
-        ct_scores = combined_df.iloc[:, score_column]
-
-        # Count total, FT-scored, and CT-scored variants
-        total_amount = len(combined_df)
-        ft_count = ft_scores.notnull().sum()
-        ct_count = ct_scores.notnull().sum()
-
-        # Count Y-chromosome null scores
-        subset_ychr = combined_df[combined_df["CHROM"] == "Y"]
-        y_chr_ft_null = subset_ychr.iloc[:, 8].isnull().sum()
-        y_chr_ct_null = subset_ychr.iloc[:, score_column].isnull().sum()
-
-        # Count nonY-chromosome null scores
-        subset_ychr = combined_df[combined_df["CHROM"] != "Y"]
-        noy_chr_ft_null = subset_ychr.iloc[:, 8].isnull().sum()
-        noy_chr_ct_null = subset_ychr.iloc[:, score_column].isnull().sum()
-
-        # Data for the bar plot
-        labels = ['Total Variants', 'FT-Scored', 'CT-Scored']
-        bar_values = np.array([total_amount, ft_count, ct_count])
-        stacked_values = np.array([0, y_chr_ft_null, y_chr_ct_null])
-        stacked_twovalues = np.array([0, noy_chr_ft_null, noy_chr_ct_null])
-
-        # Create the bar plot
-        plt.figure(figsize=(8, 6))
-        plt.bar(labels, bar_values, color='steelblue', label='Scored')
-        plt.bar(labels, stacked_values, bottom=bar_values, color='darkorange', label='Not scored from Y-chr')
-        plt.bar(labels, stacked_twovalues, bottom=bar_values + stacked_values, color='mediumpurple',
-                label='Not scored non-Y chr')
-
-        # Add title, labels, and legend
-        plt.title(samplename + ' ' + score + ': Variants Scored', fontsize=16)
-        plt.ylabel('Number of Variants')
-        plt.legend(loc='upper left')
-        plt.grid(axis='y', linestyle='--', alpha=0.7)
-        plt.tight_layout()
-
-        # Save and show the plot
+    if not input_files:
+        raise ValueError("No input files")
+
+    # Count every input file and add the counts
+    counts = ScoredCounts()
+    with stage('read', files=len(input_files)) as metrics:
+        for file_counts in read_many(input_files, reader=scored_counts, workers=workers, executor=executor,
+                                     score=score, chunksize=chunksize):
+            if isinstance(file_counts, Exception):
+                raise file_counts
+            counts = counts + file_counts
+        metrics['rows'] = counts.total
+
+    # Data for the bar plot
+    labels = ['Total Variants', 'FT-Scored', 'CT-Scored']
+    bar_values = np.array([counts.total, counts.ft_scored, counts.ct_scored])
+    # Not scored, on the Y-chromosome and on the other chromosomes
+    stacked_values = np.array([0, counts.y_chr_ft_null, counts.y_chr_ct_null])
+    stacked_twovalues = np.array([0, counts.noy_chr_ft_null, counts.noy_chr_ct_null])
+
+    # Create the bar plot
+    fig = plt.figure(figsize=(8, 6))
+    plt.bar(labels, bar_values, color='steelblue', label='Scored')
+    plt.bar(labels, stacked_values, bottom=bar_values, color='darkorange', label='Not scored from Y-chr')
+    plt.bar(labels, stacked_twovalues, bottom=bar_values + stacked_values, color='mediumpurple',
+            label='Not scored non-Y chr')
+
+    # Add title, labels, and legend
+    plt.title(samplename + ' ' + score + ': Variants Scored', fontsize=16)
+    plt.ylabel('Number of Variants')
+    plt.legend(loc='upper left')
+    plt.grid(axis='y', linestyle='--', alpha=0.7)
+    plt.tight_layout()
+
+    # Save and show the plot
+    with stage('render', plot=output):
         plt.savefig(output)
+    if show:
         plt.show()
+    plt.close(fig)
 
-        # Print amount of variants scored
-        print(ct_count)
+    # Print amount of variants scored
+    print(counts.ct_scored)
 
-    except Exception as e:
-        print(f"An error occurred: {e}")
 
 
 
 if __name__ == "__main__":
-    samplename_hifi = 'HifiCNV P4-C4'
-    samplename_pbsv = "PBSV P13-H4"
-    score_o = 'CT-O'
-    score_p = 'CT-P'
-
-    input_files_HifiCNV = [
-        "C:/Users/Tessa.vanderVeer@radboudumc.nl/Documents/Result_analysis/CADDSV_FTvsCT/P4-C4_CADDSV_CTCPandFT.tsv",
-    ]
-    input_files_PBSV = [
-        "C:/Users/Tessa.vanderVeer@radboudumc.nl/Documents/Result_analysis/CADDSV_FTvsCT/P13-H4_CADDSV_CTCPandFT.tsv",
-    ]
-
-    output_hifi_cto = "C:/Users/Tessa.vanderVeer@radboudumc.nl/Documents/Result_analysis/CADDSV_FTvsCT/results/"+samplename_hifi+'_'+score_o+"_CADDSV_FTvsCT.png"
-    output_hifi_ctp = "C:/Users/Tessa.vanderVeer@radboudumc.nl/Documents/Result_analysis/CADDSV_FTvsCT/results/"+samplename_hifi+'_'+score_p+"_CADDSV_FTvsCT.png"
-    output_pbsv_cto = "C:/Users/Tessa.vanderVeer@radboudumc.nl/Documents/Result_analysis/CADDSV_FTvsCT/results/"+samplename_pbsv+'_'+score_o+"_CADDSV_FTvsCT.png"
-    output_pbsv_ctp = "C:/Users/Tessa.vanderVeer@radboudumc.nl/Documents/Result_analysis/CADDSV_FTvsCT/results/"+samplename_pbsv+'_'+score_p+"_CADDSV_FTvsCT.png"
-
-    amount_scored(input_files_HifiCNV, samplename_hifi, output_hifi_cto, score_o)
-    amount_scored(input_files_HifiCNV, samplename_hifi, output_hifi_ctp, score_p)
-    amount_scored(input_files_PBSV, samplename_pbsv, output_pbsv_cto, score_o)
-    amount_scored(input_files_PBSV, samplename_pbsv, output_pbsv_ctp, score_p)
-
+    # e.g. python CADDSV_FT_CT_comparison_multiplefiles.py P4-C4_CADDSV_CTCPandFT.tsv --sample "HifiCNV P4-C4"
+    import sys
+    from pipeline_cli import main
 
+    sys.exit(main(['compare-ft-ct'] + sys.argv[1:]))
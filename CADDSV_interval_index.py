@@ -0,0 +1,206 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from CADDSV_CT_processing import CandidateTable, parse_candidates, positions_in_row
+
+"""
+Sorted, memory-mappable interval index of CADDSV scored variants.
+
+Per chromosome the variants are split in length buckets (lengths up to 1, 2, 4, 8, ... bp) and sorted on START
+within a bucket. Every variant of a bucket that overlaps an SV [start, end) starts in
+[start - max_length, end), with max_length the longest variant of that bucket, so the candidates of a batch
+of SVs are found with two searchsorted calls per SV and bucket. The variants of a bucket are at least half
+as long as max_length, so the window only holds variants near the SV: a few Mb-scale CNVs do not widen the
+window of the short variants (O(buckets * log n + k) per SV for typical variant densities).
+A query gives a CandidateTable, so calc_max_path and calc_max_overlap score raw SV tables (CHROM, START, END)
+without a pre-joined CADDSV_VARS / CADDSV_SCORE column.
+"""
+
+INDEX_ARRAYS = ['starts', 'ends', 'scores', 'labels', 'ranks']
+METADATA_FILE = 'index.json'
+
+
+def chrom_key(chrom):
+    """
+    Chromosome name without 'chr' prefix, so 'chr1' and '1' use the same part of the index.
+    """
+    chrom = str(chrom)
+    return chrom[3:] if chrom.lower().startswith('chr') else chrom
+
+
+def length_bucket(lengths):
+    """
+    Length bucket of variants: b for lengths in (2 ** (b - 1), 2 ** b], 0 for lengths up to 1.
+    """
+    return np.ceil(np.log2(np.maximum(lengths, 1))).astype(np.int64)
+
+
+class IntervalIndex:
+    """
+    CADDSV variants sorted on (chromosome, length bucket, start). chroms[c] lists per length bucket of
+    chromosome c the range [begin, end) of the flat arrays and the maximum variant length in it.
+    ranks is the position of each variant in (chromosome, start) order, the candidate order of a query.
+    """
+
+    def __init__(self, starts, ends, scores, labels, ranks, chroms):
+        self.starts = starts
+        self.ends = ends
+        self.scores = scores
+        self.labels = labels
+        self.ranks = ranks
+        self.chroms = chroms
+
+    def __len__(self):
+        return len(self.starts)
+
+    @classmethod
+    def from_variants(cls, chroms, starts, ends, scores, labels=None):
+        """
+        Build the index from arrays of variants.
+
+        :param labels: variant names as written to MAX_*_VAR (default: 'chrom:start-end')
+        """
+        chroms = np.asarray([chrom_key(chrom) for chrom in chroms], dtype=str)
+        starts = np.asarray(starts, dtype=np.int64)
+        ends = np.asarray(ends, dtype=np.int64)
+        scores = pd.to_numeric(pd.Series(np.asarray(scores, dtype=object)), errors='coerce').to_numpy(
+            dtype=np.float64, copy=True)
+        # Unparsable and NaN scores never win (parse_candidates keeps a leading 'nan' only to match the
+        # row-wise max(), the index has no candidate order)
+        scores[np.isnan(scores)] = -np.inf
+        if labels is None:
+            labels = np.char.add(np.char.add(np.char.add(chroms, ':'), starts.astype(str)),
+                                 np.char.add('-', ends.astype(str)))
+        labels = np.asarray(labels, dtype=str)
+
+        ranks = np.empty(len(starts), dtype=np.int64)
+        ranks[np.lexsort((starts, chroms))] = np.arange(len(starts))
+        buckets = length_bucket(ends - starts)
+        order = np.lexsort((starts, buckets, chroms))
+        chroms, buckets, starts, ends, scores, labels, ranks = (chroms[order], buckets[order], starts[order],
+                                                                ends[order], scores[order], labels[order],
+                                                                ranks[order])
+
+        chrom_ranges = {}
+        new_range = np.r_[len(chroms) > 0, (chroms[1:] != chroms[:-1]) | (buckets[1:] != buckets[:-1])]
+        bounds = np.r_[np.flatnonzero(new_range), len(chroms)]
+        for begin, end in zip(bounds[:-1], bounds[1:]):
+            max_length = int((ends[begin:end] - starts[begin:end]).max())
+            chrom_ranges.setdefault(str(chroms[begin]), []).append((int(begin), int(end), max_length))
+        return cls(starts, ends, scores, labels, ranks, chrom_ranges)
+
+    @classmethod
+    def from_frame(cls, df, score_column='CADDSV_SCORE', label_column=None):
+        """
+        Build the index from a table of CADDSV variants with CHROM, START, END and a score column.
+        """
+        labels = df[label_column].to_numpy() if label_column is not None else None
+        return cls.from_variants(df['CHROM'].to_numpy(), df['START'].to_numpy(), df['END'].to_numpy(),
+                                 df[score_column].to_numpy(), labels)
+
+    @classmethod
+    def from_results(cls, input_files):
+        """
+        Build the index from the pre-joined candidates of _fullCADDSV_results.tsv files:
+        every distinct 'chr:start-end' candidate once, with its score.
+        """
+        variants = []
+        scores = []
+        for input_file in input_files:
+            df = pd.read_csv(input_file, sep='\t', usecols=['CADDSV_VARS', 'CADDSV_SCORE'], dtype=str)
+            candidates = parse_candidates(df)
+            valid = candidates.valid_coordinates
+            variants.append(candidates.variants[valid])
+            scores.append(candidates.scores[valid])
+        variants = pd.Series(np.concatenate(variants) if variants else [], dtype=object)
+        scores = np.concatenate(scores) if scores else np.array([])
+
+        first = ~variants.duplicated().to_numpy()
+        variants = variants[first]
+        coords = variants.str.extract(r'^([^:]*):\s*([0-9]+)\s*-\s*([0-9]+)')
+        return cls.from_variants(coords[0].to_numpy(), coords[1].astype(np.int64).to_numpy(),
+                                 coords[2].astype(np.int64).to_numpy(), scores[first], variants.to_numpy())
+
+    def save(self, index_dir):
+        """
+        Save the arrays as .npy files (memory-mappable) and the chromosome ranges as JSON.
+        """
+        os.makedirs(index_dir, exist_ok=True)
+        for name in INDEX_ARRAYS:
+            np.save(os.path.join(index_dir, name + '.npy'), getattr(self, name))
+        with open(os.path.join(index_dir, METADATA_FILE), 'w') as f:
+            json.dump({'n_variants': len(self), 'chroms': self.chroms}, f, indent=2)
+
+    @classmethod
+    def load(cls, index_dir, mmap_mode='r'):
+        """
+        Load a saved index; with mmap_mode='r' only the pages that queries touch are read from disk.
+        """
+        with open(os.path.join(index_dir, METADATA_FILE)) as f:
+            metadata = json.load(f)
+        arrays = {name: np.load(os.path.join(index_dir, name + '.npy'), mmap_mode=mmap_mode)
+                  for name in INDEX_ARRAYS}
+        chroms = {chrom: [tuple(bounds) for bounds in ranges] for chrom, ranges in metadata['chroms'].items()}
+        return cls(chroms=chroms, **arrays)
+
+    def query(self, df):
+        """
+        Candidates of all SVs in df (CHROM, START, END): every indexed variant that overlaps the SV,
+        in order of start. SVs without position or overlapping variants get no candidates.
+        """
+        starts = df['START'].to_numpy(dtype=np.float64)
+        ends = df['END'].to_numpy(dtype=np.float64)
+        has_position = ~(np.isnan(starts) | np.isnan(ends))
+        sv_chroms = df['CHROM'].astype(str).map(chrom_key).to_numpy()
+
+        rows = []
+        flat = []
+        for chrom, ranges in self.chroms.items():
+            chrom_rows = np.flatnonzero((sv_chroms == chrom) & has_position)
+            if len(chrom_rows) == 0:
+                continue
+            sv_start = starts[chrom_rows].astype(np.int64)
+            sv_end = ends[chrom_rows].astype(np.int64)
+
+            for begin, end, max_length in ranges:
+                bucket_starts = self.starts[begin:end]
+                low = np.searchsorted(bucket_starts, sv_start - max_length, side='right')
+                high = np.searchsorted(bucket_starts, sv_end, side='left')
+                counts = np.maximum(high - low, 0)
+
+                window = np.repeat(low, counts) + positions_in_row(counts) + begin
+                window_rows = np.repeat(np.arange(len(chrom_rows)), counts)
+                overlapping = self.ends[window] > sv_start[window_rows]
+                rows.append(chrom_rows[window_rows[overlapping]])
+                flat.append(window[overlapping])
+
+        rows = np.concatenate(rows) if rows else np.array([], dtype=np.int64)
+        flat = np.concatenate(flat) if flat else np.array([], dtype=np.int64)
+        # CSR layout in row order, the candidates of a row in (chromosome, start) order of the index
+        order = np.lexsort((self.ranks[flat], rows))
+        rows, flat = rows[order], flat[order]
+        candidate_rows, n_candidates = np.unique(rows, return_counts=True)
+
+        return CandidateTable(
+            n_rows=len(df),
+            rows=candidate_rows,
+            offsets=np.r_[0, np.cumsum(n_candidates)],
+            variants=self.labels[flat].astype(object),
+            scores=np.asarray(self.scores[flat]),
+            starts=np.asarray(self.starts[flat]),
+            ends=np.asarray(self.ends[flat]),
+            valid_coordinates=np.ones(len(flat), dtype=bool),
+        )
+
+
+def build_index(input_files, index_dir):
+    """
+    Build an interval index from _fullCADDSV_results.tsv files and save it to index_dir.
+    """
+    index = IntervalIndex.from_results(input_files)
+    index.save(index_dir)
+    print(f"Interval index with {len(index)} CADDSV variants on {len(index.chroms)} chromosomes saved in '{index_dir}'.")
+    return index
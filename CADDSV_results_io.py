@@ -0,0 +1,442 @@
+import hashlib
+import json
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
+
+import pandas as pd
+
+"""
+Reading and writing of processed CT results: the TSV plus an optional typed columnar
+sibling (Feather or Parquet) that readers pick up when it is present and up to date.
+"""
+
+NOT_PRESENT = "Not Present"
+BINARY_FORMATS = {'feather': '.feather', 'parquet': '.parquet'}
+CATEGORICAL_COLUMNS = ['CHROM', 'TYPE', 'CAUSAL']
+SCORE_COLUMNS = ['CADDSV_FT_Score', 'ANNOTSV_SCORE', 'ANNOTSV_ACMG_CLASS', 'MAX_PATH_SCORE', 'MAX_OVERLAP_SCORE']
+
+# Frames read so far within memoize_reads() (key -> (frame, bytes), least recently used first), None outside it
+read_memo = None
+read_memo_max_bytes = None
+read_memo_lock = threading.Lock()
+READ_MEMO_MAX_BYTES = 1024 ** 3
+
+
+def binary_path(tsv_file, binary_format):
+    """
+    Path of the binary sibling of a TSV file: results.tsv -> results.feather
+    """
+    if binary_format not in BINARY_FORMATS:
+        raise ValueError(f"Unknown binary format '{binary_format}', use one of: {', '.join(BINARY_FORMATS)}")
+    return os.path.splitext(tsv_file)[0] + BINARY_FORMATS[binary_format]
+
+
+def typed_frame(df, categorical=True):
+    """
+    Stable types for the binary format: float scores and categorical CHROM/TYPE/CAUSAL
+    (plain strings with categorical=False).
+    """
+    df = df.copy()
+    for col in SCORE_COLUMNS:
+        if col in df.columns:
+            df[col] = pd.to_numeric(df[col], errors='coerce').astype('float64')
+    for col in df.columns:
+        if col in CATEGORICAL_COLUMNS:
+            df[col] = df[col].astype('category' if categorical else 'str')
+        elif df[col].dtype == object:
+            # e.g. MAX_PATH_VAR (strings and None)
+            df[col] = df[col].astype('str').where(df[col].notna())
+    return df
+
+
+def write_binary(df, tsv_file, binary_format):
+    """
+    Write df as the binary sibling of tsv_file.
+    """
+    output_file = binary_path(tsv_file, binary_format)
+    df = typed_frame(df)
+    if binary_format == 'feather':
+        df.to_feather(output_file)
+    else:
+        df.to_parquet(output_file, index=False)
+    return output_file
+
+
+def find_binary(tsv_file):
+    """
+    Binary sibling of tsv_file that is at least as new as the TSV, or None.
+    """
+    for binary_format in BINARY_FORMATS:
+        candidate = binary_path(tsv_file, binary_format)
+        if os.path.exists(candidate) and (
+                not os.path.exists(tsv_file) or os.path.getmtime(candidate) >= os.path.getmtime(tsv_file)):
+            return candidate
+    return None
+
+
+def binary_columns(binary_file):
+    """
+    Column names of a Feather/Parquet file, read from its schema only.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    if binary_file.endswith(BINARY_FORMATS['feather']):
+        with pa.memory_map(binary_file) as source:
+            return pa.ipc.open_file(source).schema.names
+    return pq.read_schema(binary_file).names
+
+
+@contextmanager
+def memoize_reads(max_bytes=READ_MEMO_MAX_BYTES):
+    """
+    Within this context read_results parses every unchanged file only once per columns and schema and
+    returns copies after that, e.g. for several plots of one pipeline run. Not shared with worker processes.
+    The memo keeps at most max_bytes of frames, the least recently used are released first; the frames
+    are released when the (outermost) context ends.
+    """
+    global read_memo, read_memo_max_bytes
+    outer = read_memo, read_memo_max_bytes
+    if read_memo is None:
+        read_memo, read_memo_max_bytes = {}, max_bytes
+    try:
+        yield
+    finally:
+        read_memo, read_memo_max_bytes = outer
+
+
+def read_results(tsv_file, columns=None, schema=None):
+    """
+    Read a processed results file. Uses the Feather/Parquet sibling when it is present and
+    not older than the TSV, else parses the TSV.
+
+    :param columns: only parse these columns (default: all), columns missing in the file are ignored
+    :param schema: dict of column -> dtype; only these columns are read (unless columns is given),
+                   with these dtypes and "Not Present" as NA
+    """
+    memo = read_memo
+    if memo is None:
+        return parse_results(tsv_file, columns, schema)
+
+    key = cache_key(file_signature([tsv_file]), columns, schema)
+    with read_memo_lock:
+        entry = memo.pop(key, None)
+        if entry is not None:
+            # Most recently used last
+            memo[key] = entry
+            return entry[0].copy()
+
+    df = parse_results(tsv_file, columns, schema)
+    with read_memo_lock:
+        memo[key] = (df, int(df.memory_usage(deep=True).sum()))
+        total = sum(size for _, size in memo.values())
+        for old_key in list(memo):
+            if total <= read_memo_max_bytes:
+                break
+            total -= memo.pop(old_key)[1]
+    return df.copy()
+
+
+def parse_results(tsv_file, columns=None, schema=None):
+    """
+    read_results without memo.
+    """
+    if schema is not None and columns is None:
+        columns = list(schema)
+
+    binary_file = find_binary(tsv_file)
+    if binary_file is None:
+        usecols = None if columns is None else (lambda col: col in columns)
+        if schema is None:
+            return pd.read_csv(tsv_file, sep='\t', usecols=usecols)
+        return pd.read_csv(tsv_file, sep='\t', usecols=usecols, dtype=schema, na_values=[NOT_PRESENT])
+
+    if columns is not None:
+        columns = [col for col in binary_columns(binary_file) if col in columns]
+    if binary_file.endswith(BINARY_FORMATS['feather']):
+        df = pd.read_feather(binary_file, columns=columns)
+    else:
+        df = pd.read_parquet(binary_file, columns=columns)
+    return binary_frame(df, schema)
+
+
+def binary_frame(df, schema=None):
+    """
+    Dtypes of a frame read from a binary sibling: categorical CHROM/TYPE/CAUSAL and the schema.
+    """
+    # Chunked writes store plain strings, make CHROM/TYPE/CAUSAL categorical again
+    for col in CATEGORICAL_COLUMNS:
+        if col in df.columns and not isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].astype('category')
+    if schema is not None:
+        # "Not Present" scores were already stored as NA by typed_frame
+        df = df.astype({col: dtype for col, dtype in schema.items() if col in df.columns})
+    return df
+
+
+def iter_binary(binary_file, columns=None, chunksize=None):
+    """
+    Record batches of at most chunksize rows of a Feather (Arrow IPC) or Parquet file, as pyarrow Tables.
+    Yields at least one (possibly empty) table.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    if binary_file.endswith(BINARY_FORMATS['parquet']):
+        parquet_file = pq.ParquetFile(binary_file)
+        empty = parquet_file.schema_arrow.empty_table()
+        for batch in parquet_file.iter_batches(batch_size=chunksize, columns=columns):
+            empty = None
+            yield pa.Table.from_batches([batch])
+    else:
+        with pa.memory_map(binary_file) as source:
+            reader = pa.ipc.open_file(source)
+            empty = reader.schema.empty_table()
+            for i in range(reader.num_record_batches):
+                batch = reader.get_batch(i)
+                if columns is not None:
+                    batch = batch.select(columns)
+                # The batches are as large as the writer made them (the whole frame for to_feather)
+                for offset in range(0, batch.num_rows, chunksize):
+                    empty = None
+                    yield pa.Table.from_batches([batch.slice(offset, chunksize)])
+    if empty is not None:
+        yield empty if columns is None else empty.select(columns)
+
+
+def iter_results(tsv_file, schema=None, chunksize=None):
+    """
+    read_results in chunks of chunksize rows, so a file can be folded into counts without holding it in memory.
+    Yields at least one (possibly empty) frame; chunksize=None gives the whole file at once (memoized, see
+    memoize_reads). Chunks are never memoized; a binary sibling is streamed in record batches.
+
+    :param schema: dict of column -> dtype, see read_results
+    """
+    if chunksize is None:
+        yield read_results(tsv_file, schema=schema)
+        return
+
+    binary_file = find_binary(tsv_file)
+    if binary_file is not None:
+        columns = None if schema is None else [col for col in binary_columns(binary_file) if col in schema]
+        for table in iter_binary(binary_file, columns, chunksize):
+            yield binary_frame(table.to_pandas(), schema)
+        return
+
+    kwargs = {} if schema is None else {'usecols': lambda col: col in schema, 'dtype': schema,
+                                        'na_values': [NOT_PRESENT]}
+    empty = True
+    for chunk in pd.read_csv(tsv_file, sep='\t', chunksize=chunksize, **kwargs):
+        empty = False
+        yield chunk
+    if empty:
+        yield pd.read_csv(tsv_file, sep='\t', nrows=0, **kwargs)
+
+
+def concat_results(frames):
+    """
+    pd.concat that keeps categorical columns categorical when the files have different categories.
+    """
+    for col in frames[0].columns:
+        if isinstance(frames[0][col].dtype, pd.CategoricalDtype):
+            categories = pd.Index([])
+            for df in frames:
+                if col in df.columns and isinstance(df[col].dtype, pd.CategoricalDtype):
+                    categories = categories.union(df[col].cat.categories)
+            frames = [df.assign(**{col: df[col].cat.set_categories(categories)})
+                      if col in df.columns and isinstance(df[col].dtype, pd.CategoricalDtype) else df
+                      for df in frames]
+    return pd.concat(frames, ignore_index=True)
+
+
+def read_many(paths, reader=read_results, workers=None, executor='thread', **kwargs):
+    """
+    Apply reader(path, **kwargs) to all paths, concurrently if workers > 1.
+    Results are returned in the order of paths; a file that fails gives its exception instead of a result.
+
+    :param workers: number of threads/processes (default: read one file after another)
+    :param executor: 'thread' for I/O-bound loading (e.g. network shares), 'process' for CPU-bound parsing
+    """
+    if workers is None or workers <= 1:
+        results = []
+        for path in paths:
+            try:
+                results.append(reader(path, **kwargs))
+            except Exception as e:
+                results.append(e)
+        return results
+
+    if executor not in ('thread', 'process'):
+        raise ValueError(f"Unknown executor '{executor}', use 'thread' or 'process'")
+    pool_class = ThreadPoolExecutor if executor == 'thread' else ProcessPoolExecutor
+    with pool_class(max_workers=workers) as pool:
+        futures = [pool.submit(reader, path, **kwargs) for path in paths]
+        results = []
+        for future in futures:
+            try:
+                results.append(future.result())
+            except Exception as e:
+                results.append(e)
+    return results
+
+
+def file_signature(paths):
+    """
+    (path, size, mtime) of every file and of its binary siblings, used as cache key material.
+    """
+    signature = []
+    for path in paths:
+        for candidate in [path] + [binary_path(path, fmt) for fmt in BINARY_FORMATS]:
+            if os.path.exists(candidate):
+                stat = os.stat(candidate)
+                signature.append((os.path.abspath(candidate), stat.st_size, stat.st_mtime_ns))
+    return signature
+
+
+def cache_key(*parts):
+    """
+    Stable hash of JSON-serializable key parts.
+    """
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def cache_load(cache_dir, key):
+    """
+    Cached object for key, or None. A hit marks the entry as recently used.
+    """
+    path = os.path.join(cache_dir, key + '.pkl')
+    if not os.path.exists(path):
+        return None
+    try:
+        value = pd.read_pickle(path)
+    except Exception as e:
+        print(f"Ignoring unreadable cache entry {path}: {e}")
+        return None
+    os.utime(path)
+    return value
+
+
+def cache_store(cache_dir, key, value, max_bytes=2 * 1024 ** 3):
+    """
+    Store value under key, then evict least recently used entries until the cache fits in max_bytes.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    path = os.path.join(cache_dir, key + '.pkl')
+    pd.to_pickle(value, path + '.tmp')
+    os.replace(path + '.tmp', path)
+
+    entries = [os.path.join(cache_dir, name) for name in os.listdir(cache_dir) if name.endswith('.pkl')]
+    entries.sort(key=os.path.getmtime, reverse=True)
+    total = 0
+    for entry in entries:
+        total += os.path.getsize(entry)
+        if total > max_bytes and entry != path:
+            os.remove(entry)
+
+
+class ChunkedBinaryWriter:
+    """
+    Appends DataFrame chunks to a Feather or Parquet file with the schema of the first chunk.
+    """
+
+    def __init__(self, tsv_file, binary_format):
+        self.output_file = binary_path(tsv_file, binary_format)
+        self.binary_format = binary_format
+        self.schema = None
+        self.writer = None
+
+    def write(self, df):
+        import pyarrow as pa
+
+        table = pa.Table.from_pandas(typed_frame(df, categorical=False), schema=self.schema,
+                                     preserve_index=False)
+        if self.writer is None:
+            self.schema = table.schema
+            if self.binary_format == 'feather':
+                self.writer = pa.ipc.new_file(self.output_file, self.schema)
+            else:
+                import pyarrow.parquet as pq
+                self.writer = pq.ParquetWriter(self.output_file, self.schema)
+        self.writer.write_table(table)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+
+def file_sha256(path, block_size=1024 ** 2):
+    """
+    SHA-256 of the contents of a file, read in blocks.
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def manifest_path(output_file):
+    """
+    Manifest of an output file: results.tsv -> results.tsv.manifest.json
+    """
+    return output_file + '.manifest.json'
+
+
+def file_state(path):
+    """
+    Size and mtime of a file, None if it does not exist.
+    """
+    if not os.path.exists(path):
+        return None
+    stat = os.stat(path)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def write_manifest(output_file, input_file, params, outputs=None):
+    """
+    Record how output_file was made: the input file and its hash, the parameters and the written outputs.
+
+    :param params: JSON-serializable parameters that change the output
+    :param outputs: all files written (default: output_file)
+    """
+    outputs = [output_file] if outputs is None else outputs
+    manifest = {
+        'input': {'path': os.path.abspath(input_file), 'sha256': file_sha256(input_file), **file_state(input_file)},
+        'params': params,
+        'outputs': {os.path.abspath(path): file_state(path) for path in outputs},
+    }
+    with open(manifest_path(output_file) + '.tmp', 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True, default=str)
+    os.replace(manifest_path(output_file) + '.tmp', manifest_path(output_file))
+    return manifest
+
+
+def manifest_is_current(output_file, input_file, params):
+    """
+    True if the manifest of output_file records the same input contents and parameters and
+    all its outputs are unchanged since, i.e. processing input_file again would give the same files.
+    The input is only hashed when its size or mtime differ from the manifest.
+    """
+    try:
+        with open(manifest_path(output_file)) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return False
+
+    # Compare the parameters as they were written (JSON)
+    if manifest.get('params') != json.loads(json.dumps(params, sort_keys=True, default=str)):
+        return False
+    if manifest['input']['path'] != os.path.abspath(input_file):
+        return False
+    if any(file_state(path) != state for path, state in manifest['outputs'].items()):
+        return False
+
+    state = file_state(input_file)
+    if state is None:
+        return False
+    if state['size'] == manifest['input']['size'] and state['mtime_ns'] == manifest['input']['mtime_ns']:
+        return True
+    # e.g. a copied or touched file with the same contents
+    return state['size'] == manifest['input']['size'] and file_sha256(input_file) == manifest['input']['sha256']
@@ -2,89 +2,302 @@
 Creates CDB-test boxplot (incl. sex-chr data)
 """
 
+import os
+
+import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
 
+from CADDSV_results_io import concat_results, file_sha256, iter_results, read_results
+from pipeline_metrics import stage
+from quantile_sketch import QuantileSketch, load_sketches, save_sketches
+
+# Columns (and dtypes) read for the boxplots and the class 3 listing
+SCHEMA = {
+    'CHROM': 'category',
+    'START': 'Int32',
+    'END': 'Int32',
+    'TYPE': 'category',
+    'ANNOTSV_SCORE': 'float64',
+    'ANNOTSV_ACMG_CLASS': 'Int64',
+    'CDB_CLASS': 'category',
+    'MAX_PATH_SCORE': 'float64',
+    'MAX_OVERLAP_SCORE': 'float64',
+}
+CDB_CLASSES = ['class 1', 'class 2', 'class 3', 'class 4', 'class 5']
+PRINT_COLUMNS = ['CHROM', 'START', 'END', 'TYPE', 'ANNOTSV_SCORE', 'ANNOTSV_ACMG_CLASS', 'CDB_CLASS',
+                 'MAX_PATH_SCORE', 'MAX_OVERLAP_SCORE']
+
 
-def create_boxplot(input_file, output_file, score):
+def results_schema(scores):
     """
-    Reads input file and creates boxplot.
+    SCHEMA plus the scores that are not in it, so reads of other scores share the read_results memo.
+    """
+    return {**SCHEMA, **{score: SCHEMA.get(score, 'float64') for score in scores}}
 
-    :param input_file: processed results of all CDB variants: AnnotSV, CT-O and CT-P score (and general info)
-    :param output_file: boxplot file
-    :param score: for which score boxplot is made (AnnotSV, CT-O or CT-P, or ACMG class)
+
+def read_cdb_results(input_file, scores):
+    """
+    Reads the processed CDB results once for all given scores.
     """
-    df = pd.read_csv(input_file, sep='\t', header=0)
+    df = read_results(input_file, schema=results_schema(scores))
 
-    required_columns = [score, 'CDB_CLASS']
+    required_columns = scores + ['CDB_CLASS']
     for col in required_columns:
         if col not in df.columns:
             raise ValueError(f"Input file must contain the following columns: {', '.join(required_columns)}")
+    return df
+
+
+def sketch_name(score, cdb_class):
+    return f"{score}/{cdb_class}"
+
+
+def update_cdb_sketches(input_files, scores, sketch_file=None, chunksize=None):
+    """
+    Folds processed CDB results into quantile sketches per score and CDB class, without keeping the scores.
+    An existing sketch_file is extended (with its own scores) and saved again; files whose contents are
+    already in it are skipped, so sketches can be built up over runs as the CDB grows.
+
+    :param input_files: processed CDB results (any number, also none to only load sketch_file)
+    :param chunksize: read every file in chunks of this many rows
+    :return: dict of sketch_name -> QuantileSketch and metadata (scores, sources, rows, counts without score)
+    """
+    if sketch_file is not None and os.path.exists(sketch_file):
+        sketches, metadata = load_sketches(sketch_file)
+        missing_scores = [score for score in scores if score not in metadata['scores']]
+        if missing_scores:
+            raise ValueError(f"Sketch file '{sketch_file}' has no sketches of {', '.join(missing_scores)}")
+        scores = metadata['scores']
+    else:
+        sketches = {sketch_name(score, cdb_class): QuantileSketch() for score in scores for cdb_class in CDB_CLASSES}
+        metadata = {'scores': list(scores), 'sources': {}, 'rows': 0, 'without_score': {score: 0 for score in scores}}
+
+    schema = results_schema(scores)
+    required_columns = list(scores) + ['CDB_CLASS']
+    for input_file in input_files:
+        digest = file_sha256(input_file)
+        if digest in metadata['sources']:
+            print(f"Skipping {input_file}: already in the sketches (as {metadata['sources'][digest]})")
+            continue
 
+        for chunk in iter_results(input_file, schema, chunksize):
+            for col in required_columns:
+                if col not in chunk.columns:
+                    raise ValueError(f"Input file must contain the following columns: {', '.join(required_columns)}")
+            metadata['rows'] += len(chunk)
+            class_codes = pd.Categorical(chunk['CDB_CLASS'], categories=CDB_CLASSES).codes
+            for score in scores:
+                # Same variants as score_boxplot_stats
+                keep = (chunk['TYPE'] != 'INSERTION').to_numpy() if score == 'ANNOTSV' else slice(None)
+                values = chunk[score].to_numpy(dtype=np.float64, na_value=np.nan)[keep]
+                metadata['without_score'][score] += int(np.isnan(values).sum())
+                for i, cdb_class in enumerate(CDB_CLASSES):
+                    sketches[sketch_name(score, cdb_class)].update(values[class_codes[keep] == i])
+        metadata['sources'][digest] = input_file
+
+    if sketch_file is not None:
+        save_sketches(sketch_file, sketches, metadata)
+    return sketches, metadata
+
+
+def sketch_boxplot_stats(sketches, metadata, score):
+    """
+    Prints the variants without score and returns the boxplot statistics of score from the sketches.
+    """
+    print("Amount of CDB variants without "+score+":  "+str(metadata['without_score'][score]))
+    stats = []
+    for i, cdb_class in enumerate(CDB_CLASSES):
+        sketch = sketches[sketch_name(score, cdb_class)]
+        stats.append(sketch.boxplot_stats(label=f"Class {i + 1}\n{sketch.count} vars"))
+    return stats
+
+
+def class_boxplot_stats(values, class_codes, n_classes=len(CDB_CLASSES), whis=1.5):
+    """
+    Boxplot statistics per CDB class (same definitions as matplotlib's boxplot), for Axes.bxp.
+    Quartiles, whiskers and fliers are computed for all classes at once with grouped operations.
+
+    :param values: float array of scores, NaN values are left out
+    :param class_codes: class index (0 .. n_classes - 1) per value, -1 for other classes
+    :return: list of bxp stats dicts, one per class
+    """
+    keep = (class_codes >= 0) & ~np.isnan(values)
+    x = pd.Series(values[keep])
+    codes = class_codes[keep]
+    grouped = x.groupby(codes)
+
+    quartiles = grouped.quantile([0.25, 0.5, 0.75]).unstack().reindex(range(n_classes))
+    q1, med, q3 = (quartiles[q].to_numpy() for q in (0.25, 0.5, 0.75))
+    iqr = q3 - q1
+    counts = grouped.size().reindex(range(n_classes), fill_value=0).to_numpy()
+    means = grouped.mean().reindex(range(n_classes)).to_numpy()
+
+    # Lowest/highest values within whis * IQR of the box, else the box edge
+    x_values = x.to_numpy()
+    loval = (q1 - whis * iqr)[codes]
+    hival = (q3 + whis * iqr)[codes]
+    whishi = x.where(x_values <= hival).groupby(codes).max().reindex(range(n_classes)).to_numpy()
+    whislo = x.where(x_values >= loval).groupby(codes).min().reindex(range(n_classes)).to_numpy()
+    whishi = np.where(np.isnan(whishi) | (whishi < q3), q3, whishi)
+    whislo = np.where(np.isnan(whislo) | (whislo > q1), q1, whislo)
+
+    is_flier = (x_values < whislo[codes]) | (x_values > whishi[codes])
+    fliers = x[is_flier].groupby(codes[is_flier]).apply(np.asarray)
+
+    stats = []
+    for i in range(n_classes):
+        stats.append({
+            'label': f"Class {i + 1}\n{counts[i]} vars",
+            'n': counts[i],
+            'mean': means[i],
+            'med': med[i],
+            'q1': q1[i],
+            'q3': q3[i],
+            'iqr': iqr[i],
+            'whislo': whislo[i],
+            'whishi': whishi[i],
+            'fliers': fliers[i] if i in fliers.index else np.array([]),
+        })
+    return stats
+
+
+def set_score_axis(ax, score):
+    """
+    Y-axis limits, ticks and reference lines per score.
+    """
+    if score == 'ANNOTSV_SCORE' :
+        ax.set_ylim(-2, 2)
+        custom_ticks = [-1.5, -0.99, -0.9, 0, 0.9, 0.99, 1.5]
+        ax.set_yticks(custom_ticks)
+        ax.axhline(0.99, color='r', lw=1, linestyle='--')
+        ax.axhline(-0.99, color='r', lw=1, linestyle='--')
+        ax.axhline(0.90, color='C1', lw=1, linestyle=':')
+        ax.axhline(-0.90, color='C1', lw=1, linestyle=':')
+    elif score == 'ANNOTSV_ACMG_CLASS':
+        ax.set_ylim(0.5, 5.5)
+    else:
+        ax.set_ylim(-0.5, 50)
+
+
+def score_boxplot_stats(df, class_codes, score):
+    """
+    Prints the variants without score and the scored class 3 variants, returns the boxplot statistics for score.
+    """
     # Haal INSERTION uit dataframe als SCORE = ANNOTSV
     if score == 'ANNOTSV':
-        df = df[df['TYPE'] != 'INSERTION']
+        keep = (df['TYPE'] != 'INSERTION').to_numpy()
+        df, class_codes = df[keep], class_codes[keep]
 
     # print hoeveel varianten geen score hebben gekregen
     NaDf_count = df[score].isna().sum()
     print("Amount of CDB variants without "+score+":  "+str(NaDf_count))
 
-    df = df.dropna(subset=[score])
-
-    class1_df = df.loc[df['CDB_CLASS'] == 'class 1']
-    class2_df = df.loc[df['CDB_CLASS'] == 'class 2']
-    class3_df = df.loc[df['CDB_CLASS'] == 'class 3']
-    class4_df = df.loc[df['CDB_CLASS'] == 'class 4']
-    class5_df = df.loc[df['CDB_CLASS'] == 'class 5']
+    values = df[score].to_numpy(dtype=np.float64, na_value=np.nan)
 
-    data1 = class1_df[score].tolist()
-    data2 = class2_df[score].tolist()
-    data3 = class3_df[score].tolist()
-    data4 = class4_df[score].tolist()
-    data5 = class5_df[score].tolist()
-    fulldata = [data1, data2, data3, data4, data5]
-
-    df_printje = class3_df[['CHROM','START', 'END', 'TYPE', 'ANNOTSV_SCORE', 'ANNOTSV_ACMG_CLASS', 'CDB_CLASS', 'MAX_PATH_SCORE', 'MAX_OVERLAP_SCORE']]
+    class3_df = df[(class_codes == CDB_CLASSES.index('class 3')) & ~np.isnan(values)]
+    df_printje = class3_df[PRINT_COLUMNS]
     df_printje = df_printje.sort_values(score)
     print(df_printje.to_string(index=False))
 
-    plt.rcParams.update({'font.size': 14})
+    return class_boxplot_stats(values, class_codes)
 
-    # arrays doorgeven aan boxplot
-    fig = plt.figure(figsize=(10,7))
-    ax = fig.add_subplot(111)
-    plt.boxplot(fulldata,
-                medianprops=dict(lw=3, color='hotpink'))
 
-    if score == 'ANNOTSV_SCORE' :
-        plt.ylim(-2, 2)
-        custom_ticks = [-1.5, -0.99, -0.9, 0, 0.9, 0.99, 1.5]
-        plt.yticks(custom_ticks)
-        plt.axhline(0.99, color='r', lw=1, linestyle='--')
-        plt.axhline(-0.99, color='r', lw=1, linestyle='--')
-        plt.axhline(0.90, color='C1', lw=1, linestyle=':')
-        plt.axhline(-0.90, color='C1', lw=1, linestyle=':')
-    elif score == 'ANNOTSV_ACMG_CLASS':
-        plt.ylim(0.5, 5.5)
+def draw_boxplot(ax, stats, score):
+    """
+    Draws precomputed boxplot statistics of one score on ax.
+    """
+    ax.bxp(stats, medianprops=dict(lw=3, color='hotpink'))
+    set_score_axis(ax, score)
+    ax.set_ylabel(score +' scores')
+    ax.set_xlabel('CDB classes')
+    ax.set_title('Correlation '+score+' scores and CDB-classification')
+
+
+def create_boxplot(input_file, output_file, score, show=True):
+    """
+    Reads input file and creates boxplot.
+
+    :param input_file: processed results of all CDB variants: AnnotSV, CT-O and CT-P score (and general info)
+    :param output_file: boxplot file
+    :param score: for which score boxplot is made (AnnotSV, CT-O or CT-P, or ACMG class)
+    :param show: show the plot (blocks until the window is closed), use False for batch runs
+    """
+    create_boxplots(input_file, output_file, [score], show=show)
+
+
+def create_boxplots(input_files, output_file, scores, panels=False, show=True, sketch=False, sketch_file=None,
+                    chunksize=None):
+    """
+    Reads the input files once and creates the boxplots of all scores, the CDB classes are grouped only once.
+
+    :param input_files: processed results of the CDB variants (one file or a list of files, e.g. per batch):
+                        AnnotSV, CT-O and CT-P score (and general info)
+    :param output_file: boxplot file; with panels=False a pattern with '{score}' (filled in for every
+                        score, also for a single one), e.g. 'CDB_{score}_output.png'
+    :param scores: for which scores boxplots are made (AnnotSV, CT-O or CT-P, or ACMG class)
+    :param panels: all scores as panels of one figure instead of one figure per score
+    :param show: show the plots (blocks until the windows are closed), use False for batch runs
+    :param sketch: draw the boxplots from quantile sketches (update_cdb_sketches) instead of all scores;
+                   exact up to quantile_sketch.EXTREMES variants per class. The class 3 listing is left out.
+    :param sketch_file: with sketch, sketches of earlier runs to extend with input_files (which may be empty)
+                        and save again
+    :param chunksize: with sketch, read the input files in chunks of this many rows
+    """
+    if input_files is None:
+        input_files = []
+    elif isinstance(input_files, str):
+        input_files = [input_files]
+
+    if sketch:
+        with stage('sketch', files=len(input_files)) as metrics:
+            sketches, metadata = update_cdb_sketches(input_files, scores, sketch_file, chunksize)
+            rows = metrics['rows'] = metadata['rows']
+        all_stats = [sketch_boxplot_stats(sketches, metadata, score) for score in scores]
     else:
-        plt.ylim(-0.5, 50)
+        if not input_files:
+            raise ValueError("No input files")
+        with stage('read', files=len(input_files)) as metrics:
+            df = concat_results([read_cdb_results(input_file, scores) for input_file in input_files])
+            rows = metrics['rows'] = len(df)
+        class_codes = pd.Categorical(df['CDB_CLASS'], categories=CDB_CLASSES).codes
 
-    ax.set_xticklabels(['Class 1\n'+str(len(data1))+' vars', 'Class 2\n'+str(len(data2))+' vars',
-                        'Class 3\n'+str(len(data3))+' vars', 'Class 4\n'+str(len(data4))+' vars',
-                        'Class 5\n'+str(len(data5))+' vars'])
-    plt.ylabel(score +' scores')
-    plt.xlabel('CDB classes')
-    plt.title('Correlation '+score+' scores and CDB-classification')
+        all_stats = [score_boxplot_stats(df, class_codes, score) for score in scores]
 
+    plt.rcParams.update({'font.size': 14})
 
-    plt.savefig(output_file)
-    plt.show()
+    if panels:
+        n_cols = min(2, len(scores))
+        n_rows = -(-len(scores) // n_cols)
+        fig, axes = plt.subplots(n_rows, n_cols, figsize=(10 * n_cols, 7 * n_rows), squeeze=False)
+        for ax, stats, score in zip(axes.flat, all_stats, scores):
+            draw_boxplot(ax, stats, score)
+        for ax in axes.flat[len(scores):]:
+            ax.set_visible(False)
+        fig.tight_layout()
+        with stage('render', rows=rows, plot=output_file):
+            fig.savefig(output_file)
+        if show:
+            plt.show()
+        plt.close(fig)
+        return
 
-if __name__=="__main__":
+    for stats, score in zip(all_stats, scores):
+        # arrays doorgeven aan boxplot
+        fig = plt.figure(figsize=(10,7))
+        ax = fig.add_subplot(111)
+        draw_boxplot(ax, stats, score)
+
+        with stage('render', rows=rows, score=score):
+            fig.savefig(output_file.format(score=score))
+        if show:
+            plt.show()
+        plt.close(fig)
 
-    input_file = "C:/Users/Tessa.vanderVeer@radboudumc.nl/Documents/Result_analysis/CDB/CDB_fullresults_processed.tsv"
-    scores = ['ANNOTSV_SCORE', 'MAX_PATH_SCORE', 'MAX_OVERLAP_SCORE', 'ANNOTSV_ACMG_CLASS']
 
-    for score in scores:
-        output_file="C:/Users/Tessa.vanderVeer@radboudumc.nl/Documents/Result_analysis/CDB/CDB_" + score + "_output.png"
-        create_boxplot(input_file, output_file, score)
\ No newline at end of file
+if __name__=="__main__":
+    # e.g. python CDB_correlation_plot.py CDB_fullresults_processed.tsv --output-dir results
+    import sys
+    from pipeline_cli import main
+
+    sys.exit(main(['cdb-boxplot'] + sys.argv[1:]))
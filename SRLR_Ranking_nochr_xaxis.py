@@ -1,53 +1,427 @@
+import math
 import os
+from dataclasses import dataclass, field
+
 import pandas as pd
 import matplotlib.pyplot as plt
 import numpy as np
+from matplotlib.colors import LogNorm
+
+from CADDSV_results_io import (cache_key, cache_load, cache_store, concat_results, file_signature, iter_results,
+                               read_many)
+from pipeline_metrics import stage
 
 """
 Plots accuracy algorithms for all files in dir. Calculates accuracy percentages. 
 """
 
-def read_and_combine_files(input_dir, score):
+ANNOTSV_SCORES = ['ANNOTSV_SCORE', 'ANNOTSV_ACMG_CLASS']
+CT_SCORES = ['MAX_PATH_SCORE', 'MAX_OVERLAP_SCORE']
+CAUSAL_VALUES = ['Y', 'y', 'Y*']
+
+# Variants with a score above the threshold are counted, per score for causal and non-causal variants
+DEFAULT_THRESHOLDS = {
+    'MAX_PATH_SCORE': {'causal': 15, 'noncausal': 14.99},
+    'MAX_OVERLAP_SCORE': {'causal': 15, 'noncausal': 9.99},
+    'ANNOTSV_SCORE': {'causal': 0.98, 'noncausal': 0.98},
+    'ANNOTSV_ACMG_CLASS': {'causal': 0.98, 'noncausal': 0.98},
+}
+
+# Above this number of non-causal variants create_dot_plot draws them as a density instead of single dots
+DENSITY_MIN_VARIANTS = 100_000
+
+# Columns (and dtypes) that can be used for the plot and statistics
+SCHEMA = {
+    'CHROM': 'category',
+    'TYPE': 'category',
+    'CAUSAL': 'category',
+    'ANNOTSV_SCORE': 'float32',
+    'ANNOTSV_ACMG_CLASS': 'float32',
+    'MAX_PATH_SCORE': 'float32',
+    'MAX_OVERLAP_SCORE': 'float32',
+}
+
+
+def load_tsv_parts(input_dir, filenames, exclude_ins, schema=None, workers=None, executor='thread'):
+    """
+    Reads the given .tsv files of the directory, independent of the score.
+    Returns per file its DataFrame (None without 'CHROM' and 'CAUSAL' columns or if unreadable,
+    INS filtered out if exclude_ins) and its name, number of rows, columns and read error.
+    """
+    parts = []
+
+    paths = [os.path.join(input_dir, filename) for filename in filenames]
+    with stage('read', files=len(paths)) as metrics:
+        loaded = read_many(paths, workers=workers, executor=executor, schema=schema)
+        metrics['rows'] = sum(len(df) for df in loaded if not isinstance(df, Exception))
+        metrics['unreadable_files'] = sum(isinstance(df, Exception) for df in loaded)
+    for filename, df in zip(filenames, loaded):
+        if isinstance(df, Exception):
+            parts.append((None, {'filename': filename, 'rows': 0, 'columns': [], 'error': str(df)}))
+            continue
+
+        if exclude_ins and 'TYPE' in df.columns:
+            df = df[df['TYPE'] != 'INS']
+        columns = list(df.columns)
+        if not ('CHROM' in df.columns and 'CAUSAL' in df.columns):
+            df = None
+        parts.append((df, {'filename': filename, 'rows': 0 if df is None else len(df), 'columns': columns,
+                           'error': None}))
+    return parts
+
+
+def combine_parts(parts):
+    """
+    Combines load_tsv_parts output into one DataFrame of all files and the list of file descriptions.
+    """
+    all_data = [df for df, _ in parts if df is not None]
+    combined_df = concat_results(all_data) if all_data else None
+    return {'data': combined_df, 'files': [file for _, file in parts]}
+
+
+def load_tsv_files(input_dir, filenames, exclude_ins, schema=None, workers=None, executor='thread'):
+    """
+    Reads the given .tsv files of the directory, independent of the score.
+    Returns the combined DataFrame of all files with 'CHROM' and 'CAUSAL' columns (INS filtered out if exclude_ins)
+    and per file its name, number of rows in the combined DataFrame, columns and read error.
+    """
+    return combine_parts(load_tsv_parts(input_dir, filenames, exclude_ins, schema, workers, executor))
+
+
+def select_score_files(loaded, score):
+    """
+    Selects the rows of the files that have the required columns for score from load_tsv_files output.
+    """
+    required_columns = ['CHROM', 'CAUSAL'] if score is None else ['CHROM', score, 'CAUSAL']
+    selected = []
+    skipped = False
+    offset = 0
+
+    for file in loaded['files']:
+        if file['error'] is not None:
+            print(f"Error reading {file['filename']}: {file['error']}")
+        elif all(col in file['columns'] for col in required_columns):
+            selected.append((offset, offset + file['rows'], file['columns']))
+        else:
+            print(f"Skipping file {file['filename']}: Missing required columns")
+            skipped = skipped or file['rows'] > 0
+        offset += file['rows']
+
+    if not selected:
+        raise ValueError("No valid files found in the directory.")
+    if not skipped:
+        return loaded['data'].copy()
+    return pd.concat([loaded['data'].iloc[start:end][columns] for start, end, columns in selected],
+                     ignore_index=True)
+
+
+def read_and_combine_files(input_dir, score, cache_dir=None, cache_max_bytes=2 * 1024 ** 3,
+                           schema=None, workers=None, executor='thread'):
     """
     Reads all the files in the given directory and combines them into one large DataFrame.
-    Only files with the correct format (having 'CHROM', 'ANNOTSV_SCORE', and 'CAUSAL' columns) are processed.
-    """
-    all_data = []
-
-    # Loop over all files in the directory
-    for filename in os.listdir(input_dir):
-        file_path = os.path.join(input_dir, filename)
-
-        # Only process files with '.tsv' extension
-        if filename.endswith('.tsv'):
-            try:
-                # Read the file into a DataFrame
-                df = pd.read_csv(file_path, sep='\t')
-
-                # Check if the required columns exist
-                required_columns = ['CHROM', score, 'CAUSAL']
-                if all(col in df.columns for col in required_columns):
-                    # Filter out INS for AnnotSV
-                    if score == 'ANNOTSV_SCORE' or score == 'ANNOTSV_ACMG_CLASS':
-                        if 'TYPE' in df.columns:
-                            df = df[df['TYPE'] != 'INS']
-                        all_data.append(df)
-                    else:
-                        all_data.append(df)
-                else:
-                    print(f"Skipping file {filename}: Missing required columns")
-            except Exception as e:
-                print(f"Error reading {filename}: {e}")
-
-    # Combine all DataFrames into one large DataFrame
-    if all_data:
-        combined_df = pd.concat(all_data, ignore_index=True)
-        return combined_df
+    Only files with the correct format (having 'CHROM', score, and 'CAUSAL' columns) are processed.
+
+    :param cache_dir: if given, every parsed file is cached here (keyed on its path, size, mtime and schema)
+                      and reused across runs and scores; only new and changed files are read again
+    :param cache_max_bytes: size limit of cache_dir, least recently used entries are evicted
+    :param schema: dict of column -> dtype, only parse these columns (default: all, inferred dtypes);
+                   use the same schema for all scores (SCHEMA) to share the cache between them
+    :param workers: load the files concurrently with this many threads/processes
+    :param executor: 'thread' (I/O-bound) or 'process' (CPU-bound parsing)
+    """
+    filenames = [filename for filename in os.listdir(input_dir) if filename.endswith('.tsv')]
+
+    # Files are loaded (and cached) independent of the score, the score's rows are selected afterwards
+    if cache_dir is None:
+        df = select_score_files(load_tsv_files(input_dir, filenames, False, schema, workers, executor), score)
     else:
+        keys = [cache_key('load_tsv_part', file_signature([os.path.join(input_dir, filename)]), schema)
+                for filename in filenames]
+        parts = [cache_load(cache_dir, key) for key in keys]
+
+        changed = [i for i, part in enumerate(parts) if part is None]
+        if changed and len(changed) < len(filenames):
+            print(f"Reading {len(changed)} of {len(filenames)} files, the others are cached.")
+        if changed:
+            loaded = load_tsv_parts(input_dir, [filenames[i] for i in changed], False, schema, workers, executor)
+            for i, part in zip(changed, loaded):
+                parts[i] = part
+                cache_store(cache_dir, keys[i], part, cache_max_bytes)
+        df = select_score_files(combine_parts(parts), score)
+
+    # Filter out INS for AnnotSV
+    if score in ANNOTSV_SCORES and 'TYPE' in df.columns:
+        df = df[df['TYPE'] != 'INS'].reset_index(drop=True)
+    return df
+
+
+def summarize_scores(df, scores, thresholds=None, available=None):
+    """
+    Causal / non-causal totals, scored counts and counts above threshold for all scores in one grouped pass.
+
+    Per score the same variants are counted as in create_dot_plot: INS are left out for the AnnotSV scores
+    and for the non-causal MAX_OVERLAP_SCORE variants, causal AnnotSV variants count as scored when they
+    have an ANNOTSV_SCORE.
+
+    :param df: combined DataFrame (read_and_combine_files or summarize_directory)
+    :param scores: score columns to summarize
+    :param thresholds: dict score -> {'causal': threshold, 'noncausal': threshold}, default DEFAULT_THRESHOLDS
+    :param available: optional dict score -> boolean mask of the rows from files that contain the score
+    :return: tidy DataFrame with columns score, group, total, scored, above_threshold, threshold
+    """
+    thresholds = {**DEFAULT_THRESHOLDS, **(thresholds or {})}
+
+    causal = df['CAUSAL'].isin(CAUSAL_VALUES).to_numpy()
+    not_ins = (df['TYPE'] != 'INS').to_numpy() if 'TYPE' in df.columns else np.ones(len(df), dtype=bool)
+
+    flags = {}
+    for score in scores:
+        values = df[score]
+        included = available[score] if available is not None and score in available else np.ones(len(df), dtype=bool)
+        if score in ANNOTSV_SCORES:
+            included = included & not_ins
+            scored = np.where(causal, df['ANNOTSV_SCORE'].notna().to_numpy(), values.notna().to_numpy())
+        else:
+            scored = values.notna().to_numpy()
+        if score == 'MAX_OVERLAP_SCORE':
+            included = included & (causal | not_ins)
+
+        # Compared in the dtype of the score column, NaN scores are never above the threshold
+        above_causal = (values > thresholds[score]['causal']).to_numpy(dtype=bool, na_value=False)
+        above_noncausal = (values > thresholds[score]['noncausal']).to_numpy(dtype=bool, na_value=False)
+
+        flags[(score, 'total')] = included
+        flags[(score, 'scored')] = included & scored
+        flags[(score, 'above_threshold')] = included & np.where(causal, above_causal, above_noncausal)
+
+    group = pd.Series(np.where(causal, 'causal', 'noncausal'), name='group')
+    counts = pd.DataFrame(flags).groupby(group).sum().reindex(['causal', 'noncausal'], fill_value=0)
+
+    summary = counts.T.stack().unstack(level=1).rename_axis(['score', 'group'])
+    summary = summary.loc[[(score, group) for score in scores for group in counts.index]].reset_index()
+    summary['threshold'] = [thresholds[score][group] for score, group in zip(summary['score'], summary['group'])]
+    return summary[['score', 'group', 'total', 'scored', 'above_threshold', 'threshold']]
+
+
+def summarize_directory(input_dir, scores=tuple(DEFAULT_THRESHOLDS), thresholds=None, output_file=None,
+                        workers=None):
+    """
+    Loads all files in the directory once and summarizes all scores (summarize_scores).
+    Files without a score column are left out for that score, like in create_dot_plot.
+
+    :param output_file: if given, the summary table is written here as TSV
+    """
+    filenames = [filename for filename in os.listdir(input_dir) if filename.endswith('.tsv')]
+    loaded = load_tsv_files(input_dir, filenames, False, SCHEMA, workers)
+    df = select_score_files(loaded, None)
+
+    available = {}
+    file_of_row = np.repeat(np.arange(len(loaded['files'])), [file['rows'] for file in loaded['files']])
+    for score in scores:
+        file_has_score = np.array([score in file['columns'] for file in loaded['files']], dtype=bool)
+        available[score] = file_has_score[file_of_row]
+        if score not in df.columns:
+            df[score] = np.nan
+
+    summary = summarize_scores(df, scores, thresholds, available)
+    if output_file is not None:
+        summary.to_csv(output_file, sep='\t', index=False)
+    return summary
+
+
+# CAUSAL values drawn as separate sets of dots in the dot plot
+DOT_PLOT_GROUPS = ['N', 'Y', 'Y*', 'y']
+# Bins of the non-causal score histogram of DotPlotPartial, over the y-axis range of the plot
+HISTOGRAM_BINS = 500
+
+
+def score_ylim(score):
+    """
+    y-axis range of the dot plot of score.
+    """
+    if score == 'ANNOTSV_SCORE':
+        return -2, 2
+    if score == 'ANNOTSV_ACMG_CLASS':
+        return 0.5, 5.5
+    return -0.5, 50
+
+
+@dataclass
+class DotPlotPartial:
+    """
+    Mergeable dot plot statistics of consecutive rows of the combined files, so cohorts that do not fit in
+    memory can be plotted file by file (or chunk by chunk), also in different processes.
+
+    counts are the summarize_scores counts (rows causal / noncausal; columns total, scored, above_threshold),
+    points the row positions and scores per CAUSAL value. The non-causal points are dropped (None) when there
+    are more than max_points (None: no limit), histogram keeps the counts of their scores.
+    a + b is the partial of the rows of a followed by the rows of b.
+    """
+    score: str
+    rows: int
+    noncausal: int
+    counts: np.ndarray
+    points: dict
+    histogram: np.ndarray
+    max_points: int = None
+    files: list = field(default_factory=list)
+
+    @classmethod
+    def empty(cls, score, max_points=None, files=()):
+        points = {value: (np.array([], dtype=np.int64), np.array([], dtype=np.float32)) for value in DOT_PLOT_GROUPS}
+        return cls(score, 0, 0, np.zeros((2, 3), dtype=np.int64), points, np.zeros(HISTOGRAM_BINS, dtype=np.int64),
+                   max_points, list(files))
+
+    @classmethod
+    def from_frame(cls, df, score, thresholds=None, max_points=None):
+        """
+        Partial of the rows of df (combined frame, file or chunk; selected like in read_and_combine_files).
+        """
+        summary = summarize_scores(df, [score], thresholds)
+        values = df[score].to_numpy(dtype=np.float32, na_value=np.nan)
+
+        points = {}
+        for value in DOT_PLOT_GROUPS:
+            positions = np.flatnonzero((df['CAUSAL'] == value).to_numpy(dtype=bool, na_value=False))
+            points[value] = (positions, values[positions])
+        noncausal = len(points['N'][0])
+
+        scored = points['N'][1][~np.isnan(points['N'][1])]
+        histogram = np.histogram(scored, bins=HISTOGRAM_BINS, range=score_ylim(score))[0]
+        if max_points is not None and noncausal > max_points:
+            points['N'] = None
+        return cls(score, len(df), noncausal, summary[['total', 'scored', 'above_threshold']].to_numpy(dtype=np.int64),
+                   points, histogram, max_points)
+
+    def summary(self, thresholds=None):
+        """
+        The counts as summarize_scores table (score, group, total, scored, above_threshold, threshold).
+        """
+        thresholds = {**DEFAULT_THRESHOLDS, **(thresholds or {})}
+        summary = pd.DataFrame(self.counts, columns=['total', 'scored', 'above_threshold'])
+        summary.insert(0, 'score', self.score)
+        summary.insert(1, 'group', ['causal', 'noncausal'])
+        summary['threshold'] = [thresholds[self.score][group] for group in summary['group']]
+        return summary
+
+    def __add__(self, other):
+        points = {}
+        for value in DOT_PLOT_GROUPS:
+            if self.points[value] is None or other.points[value] is None:
+                points[value] = None
+            else:
+                points[value] = (np.concatenate([self.points[value][0], other.points[value][0] + self.rows]),
+                                 np.concatenate([self.points[value][1], other.points[value][1]]))
+        noncausal = self.noncausal + other.noncausal
+        if self.max_points is not None and noncausal > self.max_points:
+            points['N'] = None
+        return DotPlotPartial(self.score, self.rows + other.rows, noncausal, self.counts + other.counts, points,
+                              self.histogram + other.histogram, self.max_points, self.files + other.files)
+
+
+def dot_plot_partial(input_file, score, thresholds=None, chunksize=None, max_points=None):
+    """
+    Folds one file, chunk by chunk, into a DotPlotPartial with the rows read_and_combine_files would select.
+    Read errors and missing columns are recorded in partial.files instead of raised.
+    """
+    filename = os.path.basename(input_file)
+    # The same schema for every score (as read_and_combine_files), so the scores share the read_results memo
+    schema = {**SCHEMA, score: SCHEMA.get(score, 'float32')}
+
+    partial = DotPlotPartial.empty(score, max_points)
+    try:
+        for chunk in iter_results(input_file, schema, chunksize):
+            if not all(col in chunk.columns for col in ['CHROM', score, 'CAUSAL']):
+                return DotPlotPartial.empty(score, max_points, [{'filename': filename, 'error': None, 'selected': False}])
+            # Filter out INS for AnnotSV
+            if score in ANNOTSV_SCORES and 'TYPE' in chunk.columns:
+                chunk = chunk[chunk['TYPE'] != 'INS']
+            partial = partial + DotPlotPartial.from_frame(chunk, score, thresholds, max_points)
+    except Exception as e:
+        return DotPlotPartial.empty(score, max_points, [{'filename': filename, 'error': str(e), 'selected': False}])
+    partial.files = [{'filename': filename, 'error': None, 'selected': True}]
+    return partial
+
+
+def aggregate_dot_plot(input_dir, score, thresholds=None, chunksize=None, max_points=None, workers=None,
+                       executor='thread', cache_dir=None, cache_max_bytes=2 * 1024 ** 3):
+    """
+    DotPlotPartial of all .tsv files in the directory, without combining the files into one DataFrame.
+    Prints the same skipped files and errors as read_and_combine_files.
+
+    :param workers: fold the files concurrently with this many threads/processes
+    :param executor: 'thread' or 'process' (partials are merged in file order either way)
+    :param cache_dir: if given, the partial of every file is cached here, keyed on the file and parameters
+    """
+    filenames = [filename for filename in os.listdir(input_dir) if filename.endswith('.tsv')]
+    paths = [os.path.join(input_dir, filename) for filename in filenames]
+
+    keys = [cache_key('dot_plot_partial', file_signature([path]), score, thresholds, max_points) for path in paths]
+    partials = [cache_load(cache_dir, key) for key in keys] if cache_dir is not None else [None] * len(paths)
+    changed = [i for i, partial in enumerate(partials) if partial is None]
+    folded = read_many([paths[i] for i in changed], reader=dot_plot_partial, workers=workers, executor=executor,
+                       score=score, thresholds=thresholds, chunksize=chunksize, max_points=max_points)
+    for i, partial in zip(changed, folded):
+        if isinstance(partial, Exception):
+            raise partial
+        partials[i] = partial
+        if cache_dir is not None:
+            cache_store(cache_dir, keys[i], partial, cache_max_bytes)
+
+    combined = DotPlotPartial.empty(score, max_points)
+    for partial in partials:
+        combined = combined + partial
+
+    for file in combined.files:
+        if file['error'] is not None:
+            print(f"Error reading {file['filename']}: {file['error']}")
+        elif not file['selected']:
+            print(f"Skipping file {file['filename']}: Missing required columns")
+    if not any(file['selected'] for file in combined.files):
         raise ValueError("No valid files found in the directory.")
+    return combined
+
+
+def jitter_positions(positions, rows, seed=0, block_size=1_000_000):
+    """
+    x-axis positions of the dots: the values of 1 + rng.normal(0, 0.05, size=rows) at the given row positions,
+    drawn block by block so not all rows are needed at once.
+    """
+    order = np.argsort(positions, kind='stable')
+    sorted_positions = positions[order]
+    jitter = np.empty(len(positions))
+
+    rng = np.random.default_rng(seed)
+    for start in range(0, rows, block_size):
+        block = rng.normal(0, 0.05, size=min(block_size, rows - start))
+        low, high = np.searchsorted(sorted_positions, [start, start + len(block)])
+        jitter[order[low:high]] = block[sorted_positions[low:high] - start]
+    return 1 + jitter
+
+
+def draw_histogram_density(histogram, score, label):
+    """
+    Expected density of the jittered dots of a score histogram: every score bin spread over x like the jitter.
+    """
+    x_edges = np.linspace(0.7, 1.3, 16)
+    x_share = np.diff([0.5 * (1 + math.erf((x - 1) / (0.05 * math.sqrt(2)))) for x in x_edges])
+    y_edges = np.linspace(*score_ylim(score), len(histogram) + 1)
+    density = np.ma.masked_less(histogram[:, None] * x_share[None, :], 1)
+    if density.count():
+        plt.pcolormesh(x_edges, y_edges, density, norm=LogNorm(), cmap='Greys', rasterized=True)
+        add_density_legend(label)
+
+
+def add_density_legend(label):
+    """
+    Legend entry of a density in the Greys colormap: the legend does not draw meshes and draws hexbins
+    in the default color, a grey patch stands in for them.
+    """
+    plt.fill([], [], color=plt.get_cmap('Greys')(0.6), label=label)
 
 
-def create_dot_plot(input_dir, output_plot, name, score):
+def create_dot_plot(input_dir, output_plot, name, score, cache_dir=None, workers=None, thresholds=None, show=False,
+                    density=None, seed=0, chunksize=None, executor='thread'):
     """
     Dotplot with all dots aligned on a single vertical line (scatter).
 
@@ -55,44 +429,84 @@ def create_dot_plot(input_dir, output_plot, name, score):
     - 'N': Grey
     - 'Y' or 'Y*': Blue
     - 'y': Orange
-    """
-    df = read_and_combine_files(input_dir, score)
 
-    # Ensure necessary columns exist
-    required_columns = ['CHROM', score, 'CAUSAL']
-    for col in required_columns:
-        if col not in df.columns:
-            raise ValueError(f"Input file must contain the following columns: {', '.join(required_columns)}")
+    :param cache_dir: cache for the combined input files, see read_and_combine_files
+    :param workers: number of threads to load the input files with
+    :param thresholds: thresholds for the printed statistics, see summarize_scores
+    :param show: show the plot (blocks until the window is closed)
+    :param density: draw the non-causal variants as a (rasterized) hexbin density instead of single dots;
+                    default: only above DENSITY_MIN_VARIANTS non-causal variants. Causal variants are always dots.
+    :param seed: seed of the x-axis jitter, so plots are reproducible
+    :param chunksize: if given, fold the files in chunks of this many rows into mergeable counts (aggregate_dot_plot)
+                      instead of combining them; the same plot and statistics, but memory does not grow with the
+                      cohort. Above DENSITY_MIN_VARIANTS non-causal variants their density is drawn from a histogram.
+    :param executor: 'thread' or 'process' to fold the files with (with chunksize)
+    """
+    if chunksize is None:
+        # Only the columns used for the plots and statistics are parsed, the same for all scores
+        df = read_and_combine_files(input_dir, score, cache_dir, schema=SCHEMA, workers=workers)
+
+        # Ensure necessary columns exist
+        required_columns = ['CHROM', score, 'CAUSAL']
+        for col in required_columns:
+            if col not in df.columns:
+                raise ValueError(f"Input file must contain the following columns: {', '.join(required_columns)}")
+        partial = DotPlotPartial.from_frame(df, score, thresholds)
+    else:
+        max_points = None if density is False else DENSITY_MIN_VARIANTS
+        partial = aggregate_dot_plot(input_dir, score, thresholds, chunksize, max_points, workers, executor,
+                                     cache_dir)
 
     # Create a plot
-    plt.figure(figsize=(8, 8))
+    fig = plt.figure(figsize=(8, 8))
     ax = plt.gca()
 
-    # Masks for different CAUSAL values
-    causal_n_mask = df['CAUSAL'] == 'N'
-    causal_y_upper_mask = df['CAUSAL'] == 'Y'
-    causal_y_middle_mask = df['CAUSAL'] =='Y*'
-    causal_y_lower_mask = df['CAUSAL'] == 'y'
-
     # Add jitter to x-axis for better visualization
-    x_base = 1
-    df['X_JITTERED'] = x_base + np.random.normal(0, 0.05, size=len(df))
+    positions = [partial.points[value][0] for value in DOT_PLOT_GROUPS if partial.points[value] is not None]
+    x_jittered = np.split(jitter_positions(np.concatenate(positions), partial.rows, seed),
+                          np.cumsum([len(group) for group in positions])[:-1])
+    dots = {}
+    for value in DOT_PLOT_GROUPS:
+        if partial.points[value] is not None:
+            dots[value] = (x_jittered.pop(0), partial.points[value][1])
+
+    if density is None:
+        density = partial.noncausal > DENSITY_MIN_VARIANTS
 
     # Plot non-causal variants (N)
-    plt.scatter(
-        df['X_JITTERED'][causal_n_mask],
-        df[score][causal_n_mask],
-        s=10,
-        alpha=0.4,
-        c='slategray',
-        edgecolors='dimgrey',
-        label='Non-causal (N)'
-    )
+    if density and 'N' not in dots:
+        # Not all non-causal variants were kept, draw their density from the histogram
+        draw_histogram_density(partial.histogram, score, 'Non-causal (N)')
+    elif density:
+        # Fixed number of bins: rendering and file size do not grow with the number of variants
+        x, values = dots['N']
+        scored = ~np.isnan(values)
+        plt.hexbin(
+            x[scored],
+            values[scored],
+            gridsize=(15, 150),
+            bins='log',
+            mincnt=1,
+            cmap='Greys',
+            linewidths=0,
+            rasterized=True
+        )
+        add_density_legend('Non-causal (N)')
+    else:
+        plt.scatter(
+            dots['N'][0],
+            dots['N'][1],
+            s=10,
+            alpha=0.4,
+            c='slategray',
+            edgecolors='dimgrey',
+            label='Non-causal (N)'
+        )
 
     # Plot causal variants Y
     plt.scatter(
-        df['X_JITTERED'][causal_y_upper_mask],
-        df[score][causal_y_upper_mask],
+        dots['Y'][0],
+        dots['Y'][1],
         s=50,
         alpha=1,
         c='dodgerblue',
@@ -102,8 +516,8 @@ def create_dot_plot(input_dir, output_plot, name, score):
 
     # Plot causal variants Y*
     plt.scatter(
-        df['X_JITTERED'][causal_y_middle_mask],
-        df[score][causal_y_middle_mask],
+        dots['Y*'][0],
+        dots['Y*'][1],
         s=50,
         alpha=1,
         c='hotpink',
@@ -113,8 +527,8 @@ def create_dot_plot(input_dir, output_plot, name, score):
 
     # Plot causal variants (y)
     plt.scatter(
-        df['X_JITTERED'][causal_y_lower_mask],
-        df[score][causal_y_lower_mask],
+        dots['y'][0],
+        dots['y'][1],
         s=50,
         alpha=0.8,
         c='orange',
@@ -152,50 +566,22 @@ def create_dot_plot(input_dir, output_plot, name, score):
     # except KeyError:
     #     print('Class not present')
 
-    ## AMOUNT OF CAUSAL VARIANTS: TOTAL AND SCORED
-    if score == 'MAX_PATH_SCORE' or score == 'MAX_OVERLAP_SCORE':
-        causal_amount = df[df["CAUSAL"].isin(['Y', 'y', 'Y*'])]
-        causal_amount_scored = df[df["CAUSAL"].isin(['Y', 'y', 'Y*']) & df[score].notna()]
-        causal_above_10 = df[
-            df["CAUSAL"].isin(['Y', 'y', 'Y*']) & df[score].notna() & (df[score] > 15)]
-        print(f"Scored causal variants with a score above 10: {causal_above_10.shape[0]}")
-    else:
-        causal_amount = df[df["CAUSAL"].isin(['Y', 'y', 'Y*'])]
-        causal_amount_scored = df[df["CAUSAL"].isin(['Y', 'y', 'Y*']) & df["ANNOTSV_SCORE"].notna()]
-    print(f"Causal amount total: {causal_amount.shape[0]}")
-    print(f"Causal amount Scored: {causal_amount_scored.shape[0]}")
-
-    ## AMOUNT OF NON-CAUSAL VARIANTS: TOTAL AND SCORED
-    if score == 'MAX_PATH_SCORE':
-        noncausal_amount = df[~df["CAUSAL"].isin(['Y', 'y', 'Y*'])]
-        noncausal_amount_scored = df[~df["CAUSAL"].isin(['Y', 'y', 'Y*']) & df[score].notna()]
-        noncausal_above_10 = noncausal_amount[noncausal_amount[score] > 14.99]
-        print(f"Scored NON causal variants with a score above 14.99: {noncausal_above_10.shape[0]}")
-        print(f"NON Causal amount total: {noncausal_amount.shape[0]}")
-        print(f"NON Causal amount scored: {noncausal_amount_scored.shape[0]}")
-    elif score == 'MAX_OVERLAP_SCORE':
-        noncausal_amount = df[~df["CAUSAL"].isin(['Y', 'y', 'Y*']) & (df["TYPE"] != "INS")]
-        noncausal_amount_scored = noncausal_amount[noncausal_amount[score].notna()]
-        noncausal_above_10 = noncausal_amount[noncausal_amount[score] > 9.99]
-        print(f"Scored NON causal variants with a score above 9.99: {noncausal_above_10.shape[0]}")
-        print(f"NON Causal amount total: {noncausal_amount.shape[0]}")
-        print(f"NON Causal amount scored: {noncausal_amount_scored.shape[0]}")
-    else:
-        noncausal_amount = df[~df["CAUSAL"].isin(['Y', 'y', 'Y*'])]
-        noncausal_amount_scored = df[~df["CAUSAL"].isin(['Y', 'y', 'Y*']) & df[score].notna()]
-        noncausal_above_10 = noncausal_amount[noncausal_amount[score] > 0.98]
-        print(f"Scored NON causal variants with a score above 0.98: {noncausal_above_10.shape[0]}")
-        print(f"NON Causal amount total: {noncausal_amount.shape[0]}")
-        print(f"NON Causal amount scored: {noncausal_amount_scored.shape[0]}")
+    ## AMOUNT OF CAUSAL AND NON-CAUSAL VARIANTS: TOTAL, SCORED AND ABOVE THRESHOLD
+    summary = partial.summary(thresholds).set_index('group')
+    causal, noncausal = summary.loc['causal'], summary.loc['noncausal']
+
+    if score in CT_SCORES:
+        print(f"Scored causal variants with a score above {causal['threshold']:g}: {causal['above_threshold']}")
+    print(f"Causal amount total: {causal['total']}")
+    print(f"Causal amount Scored: {causal['scored']}")
+
+    print(f"Scored NON causal variants with a score above {noncausal['threshold']:g}: {noncausal['above_threshold']}")
+    print(f"NON Causal amount total: {noncausal['total']}")
+    print(f"NON Causal amount scored: {noncausal['scored']}")
 
 
     # Set y-axis limit
-    if score == 'ANNOTSV_SCORE':
-        plt.ylim(-2, 2)
-    elif score == 'ANNOTSV_ACMG_CLASS':
-        plt.ylim(0.5, 5.5)
-    else:
-        plt.ylim(-0.5, 50)
+    plt.ylim(*score_ylim(score))
 
     # Remove x-axis ticks and labels
     plt.xticks([])
@@ -204,23 +590,20 @@ def create_dot_plot(input_dir, output_plot, name, score):
     # Save the plot
     plt.tight_layout()
     plt.legend()
-    # plt.savefig(output_plot)
-    # plt.show()
+    # matplotlib draws the artists when saving
+    with stage('render', rows=partial.rows, plot=output_plot):
+        plt.savefig(output_plot)
+    if show:
+        plt.show()
+    plt.close(fig)
 
     print(f"Dot plot saved as: {output_plot}")
 
 
 
 if __name__ == "__main__":
+    # e.g. python SRLR_Ranking_nochr_xaxis.py LRSR_data/processed_CT --name LRSR --scores MAX_PATH_SCORE
+    import sys
+    from pipeline_cli import main
 
-    caller = "LRSR"
-    # score = "MAX_OVERLAP_SCORE"
-    score = "MAX_PATH_SCORE"
-    # score = "ANNOTSV_SCORE"
-    # score = "ANNOTSV_ACMG_CLASS"
-
-
-    inputdir="C:/Users/Tessa.vanderVeer@radboudumc.nl/Documents/Result_analysis/"+caller+"_data/processed_CT"
-    output_plot="C:/Users/Tessa.vanderVeer@radboudumc.nl/Documents/Result_analysis/"+caller+"_data/" + caller + "_" + score + "_noChr_dot_plot.png"
-
-    create_dot_plot(inputdir, output_plot, caller, score)
+    sys.exit(main(['dot-plot'] + sys.argv[1:]))
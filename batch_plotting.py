@@ -0,0 +1,59 @@
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import matplotlib
+
+"""
+Headless batch rendering of many sample/score plots in a process pool (Agg backend, figures closed after saving).
+
+A job is a tuple (name, function, kwargs), e.g.
+('P4-C4 CT-O', amount_scored, {'input_files': [...], 'samplename': 'P4-C4', 'output': '...png', 'score': 'CT-O'}).
+The plotting functions are called with show=False.
+"""
+
+def use_headless_backend():
+    """
+    Switch matplotlib to the non-interactive Agg backend (process pool initializer).
+    """
+    matplotlib.use('Agg', force=True)
+
+
+def render_job(job):
+    """
+    Renders one job and returns (name, seconds, error message or None).
+    """
+    import matplotlib.pyplot as plt
+
+    name, function, kwargs = job
+    start = time.perf_counter()
+    try:
+        function(**{**kwargs, 'show': False})
+        error = None
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+    finally:
+        plt.close('all')
+    return name, time.perf_counter() - start, error
+
+
+def render_batch(jobs, workers=None):
+    """
+    Renders all jobs concurrently and reports the render time per figure.
+
+    :param jobs: list of (name, function, kwargs) tuples
+    :param workers: number of processes (default: number of CPUs)
+    :return: list of (name, seconds, error) in completion order
+    """
+    results = []
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers, initializer=use_headless_backend) as executor:
+        futures = [executor.submit(render_job, job) for job in jobs]
+        for done, future in enumerate(as_completed(futures), start=1):
+            name, seconds, error = future.result()
+            status = "done" if error is None else f"FAILED ({error})"
+            print(f"[{done}/{len(jobs)}] {name}: {status} in {seconds:.2f}s")
+            results.append((name, seconds, error))
+
+    failed = sum(error is not None for _, _, error in results)
+    print(f"Rendered {len(results) - failed} figures in {time.perf_counter() - start:.1f}s, {failed} failed.")
+    return results
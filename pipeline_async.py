@@ -0,0 +1,201 @@
+import asyncio
+import contextlib
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from batch_plotting import render_job, use_headless_backend
+from CADDSV_CT_processing import (batch_summary, changed_inputs, output_path, print_batch_summary, read_input,
+                                  record_manifest, score_frame)
+from CADDSV_results_io import write_binary
+from pipeline_metrics import stage
+
+"""
+Cohort run with overlapping stages: reading the next samples, CT scoring in a process pool, writing the
+outputs and rendering the per-sample FT vs. CT barplots all run at the same time.
+
+    read (threads) -> queue -> score (processes) -> queue -> write (threads) -> queue -> render (processes)
+
+The queues are bounded (queue_size), so a slow stage holds back the stages before it instead of piling up
+samples in memory. At most queue_size samples wait between two stages and at most max_in_flight samples
+(default: score_workers) are being scored, each also pickled to and from its scoring process; the writers hold
+one sample each. The outputs are the same as process_files (whole-file process_file); a failing sample or
+barplot is reported and collected instead of aborting the run.
+"""
+
+CT_PLOT_SCORES = ['CT-O', 'CT-P']
+
+
+def read_sample(input_file):
+    with stage('read', file=input_file) as metrics:
+        df = read_input(input_file)
+        metrics['rows'] = len(df)
+    return df
+
+
+def write_sample(df, input_file, output_file, min_reciprocal_overlap=0.1, binary_format=None, reference_index=None,
+                 summaries=None):
+    with stage('write', rows=len(df), file=output_file):
+        df.to_csv(output_file, sep='\t', index=False)
+        if binary_format is not None:
+            write_binary(df, output_file, binary_format)
+    record_manifest(input_file, output_file, min_reciprocal_overlap, binary_format, reference_index, summaries)
+    print(f"Processing complete. Updated file saved as '{output_file}'.")
+
+
+def sample_plot_jobs(output_file, plot_format):
+    """
+    Render jobs (batch_plotting) of the FT vs. CT barplots of one processed sample.
+    """
+    from CADDSV_FT_CT_comparison_multiplefiles import amount_scored
+
+    samplename = os.path.basename(output_file).replace("_CADDSV_CTCPandFT.tsv", "")
+    directory = os.path.dirname(output_file)
+    return [(f"{samplename} {score}", amount_scored,
+             {'input_files': [output_file], 'samplename': samplename, 'score': score,
+              'output': os.path.join(directory, f"{samplename}_{score}_CADDSV_FTvsCT.{plot_format}")})
+            for score in CT_PLOT_SCORES]
+
+
+async def run_stage(inbox, outbox, workers, handle, slots=None):
+    """
+    Run `workers` consumers that apply the coroutine handle(item) to every item of inbox and put the
+    results (if not None) in outbox. A None item ends the stage; it is passed on once all consumers stopped.
+
+    :param slots: asyncio.Semaphore that a consumer holds from taking an item until its result is in outbox,
+                  so at most that many items are in the stage whatever the number of workers
+    """
+    async def consume():
+        while True:
+            async with slots if slots is not None else contextlib.nullcontext():
+                item = await inbox.get()
+                if item is None:
+                    # Let the other consumers of this stage stop too
+                    await inbox.put(None)
+                    return
+                result = await handle(item)
+                if result is not None and outbox is not None:
+                    await outbox.put(result)
+
+    await asyncio.gather(*(consume() for _ in range(workers)))
+    if outbox is not None:
+        await outbox.put(None)
+
+
+async def run_cohort_async(input_files, output_dir=None, min_reciprocal_overlap=0.1, binary_format=None,
+                           reference_index=None, summaries=None, incremental=True, io_workers=2, score_workers=None,
+                           render_workers=1, queue_size=2, plot_format=None, max_in_flight=None):
+    """
+    Coroutine of run_cohort; returns the failures (dict of input file -> error).
+    """
+    loop = asyncio.get_running_loop()
+    score_workers = score_workers or os.cpu_count()
+    max_in_flight = max_in_flight or score_workers
+    failures = {}
+    start = time.perf_counter()
+
+    changed = input_files
+    if incremental:
+        changed = changed_inputs(input_files, output_dir, min_reciprocal_overlap, binary_format, reference_index,
+                                 summaries)
+
+    done = 0
+
+    def report(input_file, error=None):
+        nonlocal done
+        done += 1
+        if error is not None:
+            failures[input_file] = f"{type(error).__name__}: {error}"
+        status = "done" if error is None else f"FAILED ({failures[input_file]})"
+        print(f"[{done}/{len(changed)}] {os.path.basename(input_file)} {status} ({time.perf_counter() - start:.1f}s)")
+
+    score_queue = asyncio.Queue(maxsize=queue_size)
+    write_queue = asyncio.Queue(maxsize=queue_size)
+    render_queue = asyncio.Queue(maxsize=queue_size) if plot_format is not None else None
+    # Samples being scored, each also pickled to and from its process
+    score_slots = asyncio.Semaphore(max_in_flight)
+
+    with ThreadPoolExecutor(max_workers=io_workers) as io_pool, \
+            ProcessPoolExecutor(max_workers=score_workers) as score_pool, \
+            ProcessPoolExecutor(max_workers=render_workers, initializer=use_headless_backend) as render_pool:
+
+        async def read_all():
+            # One reader, so samples enter the pipeline in input order; the queue blocks it when scoring is behind
+            for input_file in changed:
+                try:
+                    df = await loop.run_in_executor(io_pool, read_sample, input_file)
+                except Exception as e:
+                    report(input_file, e)
+                    continue
+                await score_queue.put((input_file, df))
+            await score_queue.put(None)
+
+        async def score(item):
+            input_file, df = item
+            try:
+                df = await loop.run_in_executor(score_pool, score_frame, df, min_reciprocal_overlap, reference_index,
+                                                summaries)
+            except Exception as e:
+                report(input_file, e)
+                return None
+            return input_file, df
+
+        async def write(item):
+            input_file, df = item
+            output_file = output_path(input_file, output_dir)
+            try:
+                await loop.run_in_executor(io_pool, write_sample, df, input_file, output_file, min_reciprocal_overlap,
+                                           binary_format, reference_index, summaries)
+            except Exception as e:
+                report(input_file, e)
+                return None
+            report(input_file)
+            return (input_file, output_file) if plot_format is not None else None
+
+        async def render(item):
+            input_file, output_file = item
+            errors = []
+            for job in sample_plot_jobs(output_file, plot_format):
+                name, seconds, error = await loop.run_in_executor(render_pool, render_job, job)
+                status = "done" if error is None else f"FAILED ({error})"
+                print(f"Plot {name}: {status} in {seconds:.2f}s")
+                if error is not None:
+                    errors.append(f"plot {name}: {error}")
+            # The sample itself was written, but its run is not complete without the plots
+            if errors:
+                failures[input_file] = '; '.join(errors)
+
+        with stage('run_cohort', files=len(input_files)) as metrics:
+            stages = [read_all(),
+                      run_stage(score_queue, write_queue, score_workers, score, score_slots),
+                      run_stage(write_queue, render_queue, io_workers, write)]
+            if render_queue is not None:
+                stages.append(run_stage(render_queue, None, render_workers, render))
+            await asyncio.gather(*stages)
+            metrics.update(batch_summary(input_files, changed, failures))
+
+    print_batch_summary(input_files, changed, failures)
+    return failures
+
+
+def run_cohort(input_files, output_dir=None, min_reciprocal_overlap=0.1, binary_format=None, reference_index=None,
+               summaries=None, incremental=True, io_workers=2, score_workers=None, render_workers=1, queue_size=2,
+               plot_format=None, max_in_flight=None):
+    """
+    Process a cohort of _fullCADDSV_results.tsv files with reading, scoring, writing and plotting overlapped.
+
+    :param input_files: list of _fullCADDSV_results.tsv files
+    :param output_dir: directory for the output files (default: next to each input file)
+    :param min_reciprocal_overlap, binary_format, reference_index, summaries, incremental: see process_files
+    :param io_workers: threads for reading and writing
+    :param score_workers: processes for the CT scoring (default: number of CPUs)
+    :param render_workers: processes for the plots
+    :param queue_size: samples that may wait between two stages (bounds the memory use)
+    :param plot_format: if given, render the FT vs. CT barplots of every sample in this format (png, svg, pdf)
+    :param max_in_flight: samples that may be scored at the same time (default: score_workers), lower it to
+                          bound the memory use of large samples
+    :return: dict of failed input files (also those with a failed barplot) and their error
+    """
+    return asyncio.run(run_cohort_async(input_files, output_dir, min_reciprocal_overlap, binary_format,
+                                        reference_index, summaries, incremental, io_workers, score_workers,
+                                        render_workers, queue_size, plot_format, max_in_flight))
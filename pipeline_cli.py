@@ -0,0 +1,366 @@
+import argparse
+import glob
+import inspect
+import json
+import os
+import sys
+
+"""
+Command line interface of the pipeline: CT processing, FT vs. CT comparison, CDB boxplots and dot plots.
+
+    python pipeline_cli.py process "data/*_fullCADDSV_results.tsv" --workers 8
+    python pipeline_cli.py cohort "data/*_fullCADDSV_results.tsv" --output-dir results --plots png
+    python pipeline_cli.py build-index "data/*_fullCADDSV_results.tsv" --index-dir data/caddsv_index
+    python pipeline_cli.py dot-plot data/processed_CT --name LRSR --scores MAX_PATH_SCORE MAX_OVERLAP_SCORE
+    python pipeline_cli.py pipeline cohort.json
+
+A pipeline config (JSON) runs several steps in one process, files read by an earlier step are reused:
+
+    {"defaults": {"workers": 4, "output_dir": "results"},
+     "steps": [{"command": "process", "inputs": ["data/*_fullCADDSV_results.tsv"]},
+               {"command": "dot-plot", "input_dir": "data", "name": "LRSR", "scores": ["MAX_PATH_SCORE"]}]}
+
+Step keys are the option names with '_' instead of '-'; defaults apply to every step that has that option.
+pandas, matplotlib and the scripts are imported by the commands that need them, so --help stays fast.
+"""
+
+CT_SCORES = ['CT-O', 'CT-P']
+CDB_SCORES = ['ANNOTSV_SCORE', 'MAX_PATH_SCORE', 'MAX_OVERLAP_SCORE', 'ANNOTSV_ACMG_CLASS']
+DOT_PLOT_SCORES = ['MAX_PATH_SCORE', 'MAX_OVERLAP_SCORE', 'ANNOTSV_SCORE', 'ANNOTSV_ACMG_CLASS']
+
+
+def expand_inputs(inputs):
+    """
+    Files of a list of paths and glob patterns, in the given order (patterns sorted).
+    """
+    files = []
+    for pattern in inputs:
+        matches = sorted(glob.glob(pattern)) if glob.has_magic(pattern) else [pattern]
+        if not matches:
+            raise FileNotFoundError(f"No files match '{pattern}'")
+        files.extend(matches)
+    return files
+
+
+def output_file(output_dir, filename):
+    if output_dir is not None:
+        os.makedirs(output_dir, exist_ok=True)
+        return os.path.join(output_dir, filename)
+    return filename
+
+
+def prepare_plotting(show):
+    """
+    Non-interactive backend unless the plots are shown.
+    """
+    if not show:
+        from batch_plotting import use_headless_backend
+        use_headless_backend()
+
+
+def render_plots(jobs, render_workers=None, show=False):
+    """
+    Render plot jobs (name, function, kwargs): one after another in this process, or with render_workers in a
+    headless process pool (render_batch; not with show). A failing plot is reported, the others are rendered.
+
+    :return: exit status, 1 if a plot failed
+    """
+    if render_workers is None or show:
+        status = 0
+        for name, function, kwargs in jobs:
+            try:
+                function(**kwargs, show=show)
+            except Exception as e:
+                print(f"An error occurred: {e}")
+                status = 1
+        return status
+
+    from batch_plotting import render_batch
+
+    results = render_batch(jobs, render_workers)
+    return 1 if any(error is not None for _, _, error in results) else 0
+
+
+def run_process(inputs, output_dir=None, workers=None, min_reciprocal_overlap=0.1, chunksize=None,
+                chrom_workers=None, binary_format=None, reference_index=None, incremental=True, top_k=0,
+                score_threshold=None, overlap_mean=False):
+    """
+    CT processing of _fullCADDSV_results.tsv files (process_files).
+
+    :param top_k, score_threshold, overlap_mean: extra candidate summary columns, see CandidateSummaries
+    """
+    from CADDSV_CT_processing import CandidateSummaries, process_files
+
+    summaries = CandidateSummaries(top_k, score_threshold, overlap_mean)
+    failures = process_files(expand_inputs(inputs), output_dir, workers, min_reciprocal_overlap, chunksize,
+                             chrom_workers, binary_format, reference_index, incremental, summaries)
+    return 1 if failures else 0
+
+
+def run_build_index(inputs, index_dir):
+    """
+    Interval index of the CADDSV candidates of _fullCADDSV_results.tsv files, for --reference-index (build_index).
+    """
+    from CADDSV_interval_index import build_index
+
+    build_index(expand_inputs(inputs), index_dir)
+    return 0
+
+
+def run_cohort(inputs, output_dir=None, min_reciprocal_overlap=0.1, binary_format=None, reference_index=None,
+               incremental=True, top_k=0, score_threshold=None, overlap_mean=False, io_workers=2, score_workers=None,
+               render_workers=1, queue_size=2, plots=None, max_in_flight=None):
+    """
+    CT processing of a cohort with reading, scoring, writing and the per-sample plots overlapped (run_cohort).
+
+    :param plots: format of the FT vs. CT barplots of every sample, None for no plots
+    """
+    if plots is not None:
+        prepare_plotting(False)
+    from CADDSV_CT_processing import CandidateSummaries
+    from pipeline_async import run_cohort as run_cohort_pipeline
+
+    if output_dir is not None:
+        os.makedirs(output_dir, exist_ok=True)
+    summaries = CandidateSummaries(top_k, score_threshold, overlap_mean)
+    failures = run_cohort_pipeline(expand_inputs(inputs), output_dir, min_reciprocal_overlap, binary_format,
+                                   reference_index, summaries, incremental, io_workers, score_workers,
+                                   render_workers, queue_size, plots, max_in_flight)
+    return 1 if failures else 0
+
+
+def run_compare_ft_ct(inputs, sample, scores=CT_SCORES, output_dir=None, output=None, plot_format='png',
+                      workers=None, chunksize=None, render_workers=None, show=False):
+    """
+    FT vs. CT scored barplots of the processed files of one sample (amount_scored), one per CT score.
+    """
+    prepare_plotting(show)
+    from CADDSV_FT_CT_comparison_multiplefiles import amount_scored
+
+    input_files = expand_inputs(inputs)
+    pattern = output or f"{{sample}}_{{score}}_CADDSV_FTvsCT.{plot_format}"
+    jobs = [(f"{sample} {score}", amount_scored,
+             {'input_files': input_files, 'samplename': sample, 'score': score, 'workers': workers,
+              'chunksize': chunksize, 'output': output_file(output_dir, pattern.format(sample=sample, score=score))})
+            for score in scores]
+    return render_plots(jobs, render_workers, show)
+
+
+def run_cdb_boxplot(inputs=(), scores=CDB_SCORES, output_dir=None, output=None, plot_format='png',
+                    panels=False, sketch=False, sketch_file=None, chunksize=None, render_workers=None, show=False):
+    """
+    Boxplots of the CDB classes per score (create_boxplots).
+
+    :param inputs: processed CDB results (files or glob patterns), combined into one boxplot per score
+    :param sketch_file: quantile sketches to extend with the inputs and draw the boxplots from (implies sketch)
+    """
+    if not inputs and sketch_file is None:
+        raise ValueError("cdb-boxplot needs input files or a sketch file")
+    prepare_plotting(show)
+    from CDB_correlation_plot import create_boxplots
+
+    pattern = output or (f"CDB_panels.{plot_format}" if panels else f"CDB_{{score}}_output.{plot_format}")
+    kwargs = {'input_files': expand_inputs(inputs), 'output_file': output_file(output_dir, pattern),
+              'panels': panels, 'sketch': sketch or sketch_file is not None, 'sketch_file': sketch_file,
+              'chunksize': chunksize}
+    if panels or sketch_file is not None or render_workers is None:
+        # One figure, or one job that reads the input once (and saves the sketch file once) for all scores
+        jobs = [('CDB boxplots', create_boxplots, {**kwargs, 'scores': scores})]
+    else:
+        jobs = [(f"CDB {score}", create_boxplots, {**kwargs, 'scores': [score]}) for score in scores]
+    return render_plots(jobs, render_workers, show)
+
+
+def run_dot_plot(input_dir, name, scores=('MAX_PATH_SCORE',), output_dir=None, output=None, plot_format='png',
+                 cache_dir=None, workers=None, thresholds=None, density='auto', seed=0, chunksize=None,
+                 executor='thread', render_workers=None, summary_output=None, show=False):
+    """
+    Causal vs. non-causal dot plots of all processed files of a directory (create_dot_plot), one per score.
+
+    :param thresholds: dict score -> {'causal': threshold, 'noncausal': threshold}
+    :param chunksize: stream the files in chunks of this many rows instead of combining them
+    :param summary_output: if given, the counts of all scores (summarize_directory, one pass) are written
+                           to this TSV file
+    """
+    prepare_plotting(show)
+    from SRLR_Ranking_nochr_xaxis import create_dot_plot, summarize_directory
+
+    if summary_output is not None:
+        summary_file = output_file(output_dir, summary_output.format(name=name))
+        summarize_directory(input_dir, list(scores), thresholds, summary_file, workers)
+        print(f"Summary of {', '.join(scores)} saved as: {summary_file}")
+
+    pattern = output or f"{{name}}_{{score}}_noChr_dot_plot.{plot_format}"
+    jobs = [(f"{name} {score}", create_dot_plot,
+             {'input_dir': input_dir, 'output_plot': output_file(output_dir, pattern.format(name=name, score=score)),
+              'name': name, 'score': score, 'cache_dir': cache_dir, 'workers': workers, 'thresholds': thresholds,
+              'density': {'auto': None, 'on': True, 'off': False}[density], 'seed': seed, 'chunksize': chunksize,
+              'executor': executor})
+            for score in scores]
+    return render_plots(jobs, render_workers, show)
+
+
+COMMANDS = {
+    'process': run_process,
+    'cohort': run_cohort,
+    'build-index': run_build_index,
+    'compare-ft-ct': run_compare_ft_ct,
+    'cdb-boxplot': run_cdb_boxplot,
+    'dot-plot': run_dot_plot,
+}
+
+
+def run_step(step, defaults=None):
+    """
+    Run one pipeline step: {'command': ..., option: value, ...}. Defaults are only passed to commands that
+    have the option.
+    """
+    step = dict(step)
+    command = COMMANDS[step.pop('command')]
+    parameters = inspect.signature(command).parameters
+    kwargs = {key: value for key, value in (defaults or {}).items() if key in parameters}
+    kwargs.update(step)
+    return command(**kwargs)
+
+
+def run_pipeline(config):
+    """
+    Run the steps of a pipeline config (dict or JSON file) in order; stops at the first failing step.
+    """
+    if isinstance(config, str):
+        with open(config) as f:
+            config = json.load(f)
+    for number, step in enumerate(config['steps'], start=1):
+        print(f"Step {number}/{len(config['steps'])}: {step['command']}")
+        status = run_step(step, config.get('defaults'))
+        if status:
+            return status
+    return 0
+
+
+def parse_threshold(value):
+    """
+    'SCORE=CAUSAL,NONCAUSAL' (or 'SCORE=THRESHOLD' for both) -> (score, {'causal': ..., 'noncausal': ...})
+    """
+    try:
+        score, numbers = value.split('=')
+        numbers = [float(number) for number in numbers.split(',')]
+        causal, noncausal = numbers if len(numbers) == 2 else numbers * 2
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"'{value}' is not SCORE=CAUSAL,NONCAUSAL")
+    return score, {'causal': causal, 'noncausal': noncausal}
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="CADDSV CT-score pipeline.")
+    parser.add_argument('--metrics', help="append stage metrics (JSON lines) to this file, '-' for stderr")
+    parser.add_argument('--profile-dir', help="write cProfile dumps of every stage to this directory")
+    parser.add_argument('--trace-memory', action='store_true',
+                        help="trace Python allocations per stage (metrics to stderr unless --metrics is given)")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    process = subparsers.add_parser('process', help="calculate CT-O and CT-P of _fullCADDSV_results.tsv files")
+    process.add_argument('--workers', type=int, help="processes (default: number of CPUs)")
+    process.add_argument('--chunksize', type=int, help="stream every file in chunks of this many rows")
+    process.add_argument('--chrom-workers', type=int, help="processes per file for the chromosomes")
+
+    cohort = subparsers.add_parser('cohort', help="process (and plot) a cohort with overlapping read, score, "
+                                                  "write and render stages")
+    cohort.add_argument('--io-workers', type=int, default=2, help="threads for reading and writing")
+    cohort.add_argument('--score-workers', type=int, help="processes for the scoring (default: number of CPUs)")
+    cohort.add_argument('--render-workers', type=int, default=1, help="processes for the plots")
+    cohort.add_argument('--queue-size', type=int, default=2, help="samples that may wait between two stages")
+    cohort.add_argument('--max-in-flight', type=int,
+                        help="samples that may be scored at the same time (default: --score-workers)")
+    cohort.add_argument('--plots', choices=['png', 'svg', 'pdf'], help="FT vs. CT barplots of every sample")
+
+    for process_parser in [process, cohort]:
+        process_parser.add_argument('inputs', nargs='+', help="input files or glob patterns")
+        process_parser.add_argument('--output-dir', help="default: next to each input file")
+        process_parser.add_argument('--min-reciprocal-overlap', type=float, default=0.1)
+        process_parser.add_argument('--binary-format', choices=['feather', 'parquet'],
+                                    help="also write a typed binary file")
+        process_parser.add_argument('--reference-index', help="directory of a saved CADDSV interval index")
+        process_parser.add_argument('--no-incremental', dest='incremental', action='store_false',
+                                    help="also process samples that did not change")
+        process_parser.add_argument('--top-k', type=int, default=0,
+                                    help="add the k highest candidate scores and variants")
+        process_parser.add_argument('--score-threshold', type=float,
+                                    help="add the number of candidates with a score above this threshold")
+        process_parser.add_argument('--overlap-mean', action='store_true',
+                                    help="add the overlap-weighted mean score of the overlapping candidates")
+
+    build_index = subparsers.add_parser('build-index', help="build an interval index of the CADDSV candidates "
+                                                            "for --reference-index")
+    build_index.add_argument('inputs', nargs='+', help="_fullCADDSV_results.tsv files or glob patterns")
+    build_index.add_argument('--index-dir', required=True, help="directory to save the index in")
+
+    compare = subparsers.add_parser('compare-ft-ct', help="FT vs. CT scored barplots of one sample")
+    compare.add_argument('inputs', nargs='+', help="processed files or glob patterns")
+    compare.add_argument('--sample', required=True, help="sample name for the title and output files")
+    compare.add_argument('--scores', nargs='+', choices=CT_SCORES, default=CT_SCORES)
+    compare.add_argument('--workers', type=int, help="threads to load the files")
+    compare.add_argument('--chunksize', type=int, help="count every file in chunks of this many rows")
+
+    cdb = subparsers.add_parser('cdb-boxplot', help="boxplots of the scores per CDB class")
+    cdb.add_argument('inputs', nargs='*',
+                     help="processed results of the CDB variants, files or glob patterns (optional with --sketch-file)")
+    cdb.add_argument('--scores', nargs='+', choices=CDB_SCORES, default=CDB_SCORES)
+    cdb.add_argument('--panels', action='store_true', help="all scores in one figure")
+    cdb.add_argument('--sketch', action='store_true', help="draw the boxplots from quantile sketches")
+    cdb.add_argument('--sketch-file', help="sketches of earlier runs (.npz), extended with the input and saved")
+    cdb.add_argument('--chunksize', type=int, help="with sketches, read the input in chunks of this many rows")
+
+    dot_plot = subparsers.add_parser('dot-plot', help="causal vs. non-causal dot plots of a directory")
+    dot_plot.add_argument('input_dir', help="directory with the processed .tsv files")
+    dot_plot.add_argument('--name', required=True, help="caller / cohort name for the title and output files")
+    dot_plot.add_argument('--scores', nargs='+', choices=DOT_PLOT_SCORES, default=['MAX_PATH_SCORE'])
+    dot_plot.add_argument('--cache-dir', help="cache of the parsed input files")
+    dot_plot.add_argument('--workers', type=int, help="threads to load the files")
+    dot_plot.add_argument('--threshold', dest='thresholds', action='append', type=parse_threshold,
+                          metavar='SCORE=CAUSAL,NONCAUSAL', help="threshold of the printed statistics")
+    dot_plot.add_argument('--density', choices=['auto', 'on', 'off'], default='auto',
+                          help="non-causal variants as a density (auto: for large cohorts)")
+    dot_plot.add_argument('--seed', type=int, default=0, help="seed of the x-axis jitter")
+    dot_plot.add_argument('--chunksize', type=int,
+                          help="fold the files in chunks of this many rows into counts instead of combining them")
+    dot_plot.add_argument('--executor', choices=['thread', 'process'], default='thread',
+                          help="workers are threads or processes (processes for CPU-bound folding)")
+    dot_plot.add_argument('--summary-output',
+                          help="write the counts of all scores as one table (TSV) to this file, may contain {name}")
+
+    for plot_parser in [compare, cdb, dot_plot]:
+        plot_parser.add_argument('--output-dir')
+        plot_parser.add_argument('--output', help="output file pattern with {score} (and {sample} / {name})")
+        plot_parser.add_argument('--format', dest='plot_format', choices=['png', 'svg', 'pdf'], default='png')
+        plot_parser.add_argument('--show', action='store_true', help="show the plots (interactive)")
+        plot_parser.add_argument('--render-workers', type=int,
+                                 help="render the figures in this many processes (default: one after another)")
+
+    pipeline = subparsers.add_parser('pipeline', help="run the steps of a JSON pipeline config")
+    pipeline.add_argument('config', help="JSON file with 'steps' (and 'defaults')")
+    return parser
+
+
+def main(argv=None):
+    args = vars(build_parser().parse_args(argv))
+    command = args.pop('command')
+
+    metrics = {'output': args.pop('metrics'), 'profile_dir': args.pop('profile_dir'),
+               'trace_memory': args.pop('trace_memory')}
+    if metrics['output'] or metrics['profile_dir'] or metrics['trace_memory']:
+        from pipeline_metrics import configure
+        configure(**metrics)
+
+    if args.get('thresholds') is not None:
+        args['thresholds'] = dict(args['thresholds'])
+
+    from CADDSV_results_io import memoize_reads
+    with memoize_reads():
+        if command == 'pipeline':
+            return run_pipeline(args['config'])
+        return COMMANDS[command](**args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
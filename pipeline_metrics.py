@@ -0,0 +1,177 @@
+import cProfile
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+try:
+    import resource
+except ImportError:
+    # Windows: no getrusage, peak_rss_mb uses psutil if it is installed
+    resource = None
+
+"""
+Stage-level metrics of the pipeline as JSON lines: seconds, rows/sec, peak memory and counters
+(e.g. skipped or malformed CT candidates). Disabled unless configured.
+
+process_peak_rss_mb is the high-water mark of the whole process up to the end of the stage, not of the stage
+itself: a stage after a larger one repeats the earlier peak. Use CADDSV_TRACE_MEMORY (peak_traced_mb) for the
+peak of a single stage.
+
+Configuration is kept in environment variables, so worker processes (process pools) inherit it:
+CADDSV_METRICS      file the JSON lines are appended to ('-' for stderr)
+CADDSV_PROFILE_DIR  directory for a cProfile dump (.prof) of every outermost stage
+CADDSV_TRACE_MEMORY '1' to trace Python allocations (tracemalloc): peak per stage and a snapshot dump
+                    (.tracemalloc, in CADDSV_PROFILE_DIR) of every outermost stage; slows the pipeline down.
+                    tracemalloc counts the allocations of all threads, so peak_traced_mb (and the profiles)
+                    are only given for stages of the main thread, not for e.g. pipeline_async's reads and writes
+"""
+
+METRICS_ENV = 'CADDSV_METRICS'
+PROFILE_DIR_ENV = 'CADDSV_PROFILE_DIR'
+TRACE_MEMORY_ENV = 'CADDSV_TRACE_MEMORY'
+
+# _local.open_stages: per thread the running traced-memory peaks of its open stages, outermost first
+_local = threading.local()
+_dump_count = 0
+
+
+def configure(output=None, profile_dir=None, trace_memory=False):
+    """
+    Enable metrics for this process and the worker processes it starts; configure() disables them again.
+
+    :param output: JSON lines file ('-' for stderr)
+    :param profile_dir: directory for cProfile (and with trace_memory tracemalloc) dumps per outermost stage
+    :param trace_memory: trace Python allocations for the peak per stage; on its own the metrics go to stderr
+    """
+    if trace_memory and output is None and profile_dir is None:
+        output = '-'
+    for name, value in [(METRICS_ENV, output), (PROFILE_DIR_ENV, profile_dir),
+                        (TRACE_MEMORY_ENV, '1' if trace_memory else None)]:
+        if value is None:
+            os.environ.pop(name, None)
+        else:
+            os.environ[name] = value
+    if profile_dir is not None:
+        os.makedirs(profile_dir, exist_ok=True)
+
+
+def enabled():
+    """
+    True if metrics or profiles are configured.
+    """
+    return bool(os.environ.get(METRICS_ENV) or os.environ.get(PROFILE_DIR_ENV))
+
+
+def peak_rss_mb():
+    """
+    Peak resident set size of this process since it started, in MB (ru_maxrss is in kB on Linux, bytes on
+    macOS; the peak working set on Windows). None if it cannot be measured (Windows without psutil).
+    """
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 1024 ** 2 if sys.platform == 'darwin' else peak / 1024
+    try:
+        import psutil
+    except ImportError:
+        return None
+    memory = psutil.Process().memory_info()
+    return getattr(memory, 'peak_wset', memory.rss) / 1024 ** 2
+
+
+def emit(record):
+    """
+    Write one JSON line to the configured output.
+    """
+    output = os.environ.get(METRICS_ENV)
+    if not output:
+        return
+    line = json.dumps(record, default=str) + '\n'
+    if output == '-':
+        sys.stderr.write(line)
+    else:
+        # One write per line in append mode, so lines of parallel processes do not interleave
+        with open(output, 'a') as f:
+            f.write(line)
+
+
+def _dump_path(name, extension):
+    global _dump_count
+    _dump_count += 1
+    safe_name = ''.join(c if c.isalnum() or c in '-_' else '_' for c in name)
+    return os.path.join(os.environ[PROFILE_DIR_ENV], f"{safe_name}-{os.getpid()}-{_dump_count}{extension}")
+
+
+@contextmanager
+def stage(name, rows=None, **fields):
+    """
+    Measure a pipeline stage. Yields a dict for the caller to fill in: 'rows' (if not known on entry)
+    and counters, e.g. metrics['malformed_scores'] = 3. Emits one JSON line when the stage ends:
+
+    {"stage": "score_frame", "seconds": 1.2, "rows": 100000, "rows_per_sec": 83333.3,
+     "process_peak_rss_mb": 512.0, ...}
+
+    Stages can be nested, only the outermost stage of the main thread is profiled.
+    """
+    metrics = dict(fields)
+    if rows is not None:
+        metrics['rows'] = rows
+    if not enabled():
+        yield metrics
+        return
+
+    if not hasattr(_local, 'open_stages'):
+        _local.open_stages = []
+    open_stages = _local.open_stages
+    outermost = not open_stages
+    # Profiles and traced peaks cover the whole process, so only stages of the main thread get them
+    main_thread = threading.current_thread() is threading.main_thread()
+    trace_memory = os.environ.get(TRACE_MEMORY_ENV) == '1' and main_thread
+    profile_dir = os.environ.get(PROFILE_DIR_ENV)
+
+    if trace_memory:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        if open_stages:
+            open_stages[-1] = max(open_stages[-1], tracemalloc.get_traced_memory()[1])
+        tracemalloc.reset_peak()
+    open_stages.append(0)
+
+    profiler = cProfile.Profile() if profile_dir and outermost and main_thread else None
+    if profiler is not None:
+        profiler.enable()
+    start = time.perf_counter()
+    try:
+        yield metrics
+    finally:
+        seconds = time.perf_counter() - start
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(_dump_path(name, '.prof'))
+
+        peak_traced = open_stages.pop()
+        record = {
+            'time': datetime.now(timezone.utc).isoformat(timespec='milliseconds'),
+            'stage': name,
+            'pid': os.getpid(),
+            'seconds': round(seconds, 6),
+        }
+        record.update(metrics)
+        if metrics.get('rows') is not None and seconds > 0:
+            record['rows_per_sec'] = round(metrics['rows'] / seconds, 1)
+        peak_rss = peak_rss_mb()
+        if peak_rss is not None:
+            record['process_peak_rss_mb'] = round(peak_rss, 1)
+        if trace_memory:
+            peak_traced = max(peak_traced, tracemalloc.get_traced_memory()[1])
+            record['peak_traced_mb'] = round(peak_traced / 1024 ** 2, 1)
+            # The enclosing stage keeps its own peak
+            if open_stages:
+                open_stages[-1] = max(open_stages[-1], peak_traced)
+            if outermost and profile_dir:
+                tracemalloc.take_snapshot().dump(_dump_path(name, '.tracemalloc'))
+        emit(record)
@@ -0,0 +1,181 @@
+import json
+
+import numpy as np
+
+"""
+Mergeable quantile sketch (merging t-digest) for boxplots of score distributions that grow with the database.
+
+A sketch keeps the count, sum, min and max exactly, a bounded number of centroids (mean, weight) for the
+quantiles and the `extremes` smallest and largest values for the whiskers and fliers. Up to `extremes` values
+the sketch holds all values and its boxplot statistics are exact. Sketches of files, chunks or earlier runs are
+combined with a + b (or update with more values) and saved with save_sketches / load_sketches.
+"""
+
+COMPRESSION = 200
+EXTREMES = 10_000
+
+
+def merge_centroids(means, weights, compression=COMPRESSION):
+    """
+    Merge sorted-by-mean centroids so each covers at most one unit of the t-digest scale function
+    k(q) = compression / (2 pi) * arcsin(2q - 1): small centroids in the tails, larger ones around the median.
+    """
+    order = np.argsort(means, kind='stable')
+    means, weights = means[order], weights[order]
+    total = weights.sum()
+    q_left = (np.cumsum(weights) - weights) / total
+    scale = compression / (2 * np.pi) * np.arcsin(2 * q_left - 1)
+    groups = np.floor(scale - scale[0]).astype(np.int64)
+
+    starts = np.flatnonzero(np.r_[True, groups[1:] != groups[:-1]])
+    merged_weights = np.add.reduceat(weights, starts)
+    merged_means = np.add.reduceat(means * weights, starts) / merged_weights
+    return merged_means, merged_weights
+
+
+class QuantileSketch:
+    """
+    Quantile sketch of a stream of values (NaN values are left out).
+    low and high are the sorted `extremes` smallest and largest values.
+    """
+
+    def __init__(self, compression=COMPRESSION, extremes=EXTREMES):
+        self.compression = compression
+        self.extremes = extremes
+        self.count = 0
+        self.total = 0.0
+        self.min = np.inf
+        self.max = -np.inf
+        self.means = np.array([])
+        self.weights = np.array([])
+        self.low = np.array([])
+        self.high = np.array([])
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def exact(self):
+        """
+        True while the sketch holds all values (in low).
+        """
+        return self.count <= self.extremes
+
+    def update(self, values):
+        """
+        Add an array of values.
+        """
+        values = np.asarray(values, dtype=np.float64)
+        values = values[~np.isnan(values)]
+        if len(values) == 0:
+            return self
+        other = QuantileSketch(self.compression, self.extremes)
+        other.count = len(values)
+        other.total = float(values.sum())
+        other.min = float(values.min())
+        other.max = float(values.max())
+        other.means = values
+        other.weights = np.ones(len(values))
+        other.low = np.sort(values)[:self.extremes]
+        other.high = np.sort(values)[-self.extremes:]
+        merged = self + other
+        vars(self).update(vars(merged))
+        return self
+
+    def __add__(self, other):
+        merged = QuantileSketch(self.compression, self.extremes)
+        merged.count = self.count + other.count
+        merged.total = self.total + other.total
+        merged.min = min(self.min, other.min)
+        merged.max = max(self.max, other.max)
+        if merged.count > 0:
+            merged.means, merged.weights = merge_centroids(np.r_[self.means, other.means],
+                                                           np.r_[self.weights, other.weights], self.compression)
+        merged.low = np.sort(np.r_[self.low, other.low])[:self.extremes]
+        merged.high = np.sort(np.r_[self.high, other.high])[-self.extremes:]
+        return merged
+
+    def quantile(self, q):
+        """
+        Estimated quantiles (linear interpolation like np.percentile); exact while the sketch holds all values.
+        """
+        q = np.asarray(q, dtype=np.float64)
+        if self.count == 0:
+            return np.full(q.shape, np.nan)
+        if self.exact:
+            return np.quantile(self.low, q)
+        # Centroid means are placed at the middle of their weight, min and max at the ends
+        centers = np.cumsum(self.weights) - self.weights / 2
+        return np.interp(q * self.count, np.r_[0, centers, self.count], np.r_[self.min, self.means, self.max])
+
+    def boxplot_stats(self, label=None, whis=1.5):
+        """
+        Boxplot statistics for Axes.bxp, with the same definitions as matplotlib's boxplot.
+        Whiskers and fliers are exact as long as the kept extremes reach within the whiskers; otherwise the
+        whisker is set at its limit (q1 / q3 -/+ whis * IQR) and only the kept extremes are drawn as fliers.
+        """
+        q1, med, q3 = self.quantile([0.25, 0.5, 0.75])
+        iqr = q3 - q1
+        stats = {'label': label, 'n': self.count, 'mean': self.total / self.count if self.count else np.nan,
+                 'med': med, 'q1': q1, 'q3': q3, 'iqr': iqr}
+        if self.count == 0:
+            stats.update(whislo=np.nan, whishi=np.nan, fliers=np.array([]))
+            return stats
+
+        # Lowest/highest values within whis * IQR of the box, else the box edge
+        loval, hival = q1 - whis * iqr, q3 + whis * iqr
+        inside_low = self.low[self.low >= loval]
+        inside_high = self.high[self.high <= hival]
+        whislo = inside_low.min() if len(inside_low) else loval
+        whishi = inside_high.max() if len(inside_high) else hival
+        whislo = q1 if whislo > q1 else whislo
+        whishi = q3 if whishi < q3 else whishi
+
+        if self.exact:
+            fliers = self.low[(self.low < whislo) | (self.low > whishi)]
+        else:
+            fliers = np.r_[self.low[self.low < whislo], self.high[self.high > whishi]]
+        stats.update(whislo=whislo, whishi=whishi, fliers=fliers)
+        return stats
+
+    def to_arrays(self, prefix):
+        """
+        Arrays (and JSON metadata) of the sketch for np.savez, names starting with prefix.
+        """
+        metadata = {'compression': self.compression, 'extremes': self.extremes, 'count': self.count,
+                    'total': self.total, 'min': self.min, 'max': self.max}
+        arrays = {prefix + name: getattr(self, name) for name in ['means', 'weights', 'low', 'high']}
+        arrays[prefix + 'metadata'] = np.array(json.dumps(metadata))
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, arrays, prefix):
+        metadata = json.loads(str(arrays[prefix + 'metadata']))
+        sketch = cls(metadata['compression'], metadata['extremes'])
+        sketch.count, sketch.total = metadata['count'], metadata['total']
+        sketch.min, sketch.max = metadata['min'], metadata['max']
+        for name in ['means', 'weights', 'low', 'high']:
+            setattr(sketch, name, arrays[prefix + name])
+        return sketch
+
+
+def save_sketches(path, sketches, metadata=None):
+    """
+    Save a dict of name -> QuantileSketch (and JSON metadata) in one .npz file.
+    """
+    arrays = {'names': np.array(json.dumps(list(sketches))), 'metadata': np.array(json.dumps(metadata or {}))}
+    for i, sketch in enumerate(sketches.values()):
+        arrays.update(sketch.to_arrays(f'{i}_'))
+    with open(path, 'wb') as f:
+        np.savez_compressed(f, **arrays)
+
+
+def load_sketches(path):
+    """
+    Load the dict of sketches and the metadata saved by save_sketches.
+    """
+    with np.load(path) as arrays:
+        names = json.loads(str(arrays['names']))
+        sketches = {name: QuantileSketch.from_arrays(arrays, f'{i}_') for i, name in enumerate(names)}
+        metadata = json.loads(str(arrays['metadata']))
+    return sketches, metadata